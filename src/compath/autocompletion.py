@@ -0,0 +1,131 @@
+# -*- coding: utf-8 -*-
+
+"""Prefix indexes used to autocomplete gene symbols and pathway names without querying the database.
+
+Each index keeps the lower-cased texts in a sorted list, so the completions of a prefix are found with a binary search
+followed by a scan of the next entries. Matches at the start of the text are ranked before matches at the start of
+another word of the text (e.g., "signaling" for "MAPK signaling pathway"), and both are sorted alphabetically.
+"""
+
+import logging
+import re
+from bisect import bisect_left
+
+from compath.constants import AUTOCOMPLETION_TOP
+
+__all__ = [
+    'PrefixIndex',
+    'build_gene_completions',
+    'build_pathway_completions',
+]
+
+log = logging.getLogger(__name__)
+
+#: Start of the words of a text other than the first one
+WORD_START = re.compile(r'(?<=[\s\-/(,])\w')
+
+
+class PrefixIndex(object):
+    """Sorted arrays of texts searched with bisect."""
+
+    def __init__(self, entries, word_prefixes=False):
+        """Build the index.
+
+        :param iter[tuple[str,Any]] entries: text and value pairs. The value is returned when the text is completed
+        :param bool word_prefixes: also complete the words in the middle of the texts
+        """
+        self.values = []
+
+        text_keys = []
+        word_keys = []
+
+        for position, (text, value) in enumerate(entries):
+            self.values.append(value)
+
+            text = text.lower()
+            text_keys.append((text, position))
+
+            if word_prefixes:
+                word_keys.extend(
+                    (text[match.start():], position)
+                    for match in WORD_START.finditer(text)
+                )
+
+        #: sorted keys and the position of their value for the starts of the texts and the starts of the other words
+        self.levels = []
+
+        for keys in (text_keys, word_keys):
+            keys.sort()
+            self.levels.append((
+                [key for key, _ in keys],
+                [position for _, position in keys],
+            ))
+
+    def __len__(self):
+        """Return the number of texts in the index."""
+        return len(self.values)
+
+    def complete(self, prefix, top=AUTOCOMPLETION_TOP):
+        """Return the values of the texts that start with the prefix.
+
+        :param str prefix: prefix typed by the user (case insensitive)
+        :param int top: maximum number of completions
+        :rtype: list
+        """
+        prefix = prefix.lower()
+
+        if not prefix:
+            return []
+
+        results = []
+        seen = set()
+
+        for keys, positions in self.levels:
+            for index in range(bisect_left(keys, prefix), len(keys)):
+                if not keys[index].startswith(prefix):
+                    break
+
+                position = positions[index]
+
+                if position in seen:
+                    continue
+
+                seen.add(position)
+                results.append(self.values[position])
+
+                if len(results) == top:
+                    return results
+
+        return results
+
+
+def build_gene_completions(gene_universe, pathway_index):
+    """Build the autocompletion of the HGNC symbols.
+
+    :param set[str] gene_universe: all HGNC symbols
+    :param compath.pathway_index.PathwayIndex pathway_index: pathway index
+    :rtype: PrefixIndex
+    """
+    return PrefixIndex(
+        (symbol, symbol)
+        for symbol in set(gene_universe).union(pathway_index.gene_to_pathways)
+    )
+
+
+def build_pathway_completions(pathway_index):
+    """Build the autocompletion of the pathway names of each resource.
+
+    :param compath.pathway_index.PathwayIndex pathway_index: pathway index
+    :rtype: dict[str,PrefixIndex]
+    :return: resource to index of its pathway names with (resource, pathway name, pathway id) values
+    """
+    return {
+        resource: PrefixIndex(
+            (
+                (pathway_name, (resource, pathway_name, pathway_id))
+                for pathway_id, (pathway_name, _) in pathways.items()
+            ),
+            word_prefixes=True,
+        )
+        for resource, pathways in pathway_index.pathways.items()
+    }
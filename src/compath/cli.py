@@ -12,12 +12,23 @@ import click
 from flask_security import SQLAlchemyUserDatastore
 
 from compath import managers
-from compath.constants import ADMIN_EMAIL, DEFAULT_CACHE_CONNECTION
+from compath.clustering import Clustering
+from compath.constants import (
+    ADMIN_EMAIL, CLUSTERGRAMMER_DIR, CLUSTERING_PATH, DEFAULT_CACHE_CONNECTION, LANDSCAPE_MIN_SIMILARITY,
+    LANDSCAPE_PATH, NULL_RUNS, NULL_SIZES, REFRESH_INTERVAL, SIMULATE_RESOURCES, SIMULATION_MAX_THRESHOLD,
+    SIMULATION_PATH
+)
 from compath.curation.hierarchies import load_hierarchy
 from compath.curation.parser import parse_curation_template, parse_special_mappings
+from compath.distributions import query_gene_sets, query_pathway_size_distribution, store_distributions
+from compath.landscape import LandscapeNetwork
 from compath.manager import Manager
 from compath.models import Base, Role, User
+from compath.pathway_index import PathwayIndex
+from compath.simulation import get_combinations, save_simulations, simulate_combinations, simulate_null_coverage
+from compath.state import get_database_date, load_gene_universe
 from compath.utils import _iterate_user_strings
+from compath.visualization.clustergrammer import ClustergrammerMatrix
 
 log = logging.getLogger(__name__)
 
@@ -72,12 +83,24 @@ def ls():
 @click.option('--static-folder', help="Template folder. Defaults to 'static'")
 @click.option('-v', '--debug', count=True, help="Turn on debugging.")
 @click.option('-c', '--connection', help="Defaults to {}".format(DEFAULT_CACHE_CONNECTION))
-def web(host, port, template_folder, static_folder, debug, connection):
+@click.option('--no-snapshot', is_flag=True, help="Recompute everything instead of using the snapshot")
+@click.option('--background-warmup', is_flag=True, help="Start serving right away and load the data in the background")
+@click.option('--refresh-interval', type=float, default=REFRESH_INTERVAL, show_default=True,
+              help="Seconds between checks for repopulated resources. Set to 0 to disable")
+def web(host, port, template_folder, static_folder, debug, connection, no_snapshot, background_warmup,
+        refresh_interval):
     """Run web service."""
     set_debug_param(debug)
 
     from compath.web import create_app
-    app = create_app(connection=connection, template_folder=template_folder, static_folder=static_folder)
+    app = create_app(
+        connection=connection,
+        template_folder=template_folder,
+        static_folder=static_folder,
+        use_snapshot=not no_snapshot,
+        background_warmup=background_warmup,
+        refresh_interval=refresh_interval,
+    )
     app.run(host=host, port=port)
 
 
@@ -89,8 +112,10 @@ def populate(debug, connection, delete_first):
     """Populate all registered Bio2BEL pathway packages."""
     set_debug_param(debug)
 
-    for name, Manager in managers.items():
-        m = Manager(connection=connection)
+    compath_manager = Manager.from_connection(connection=connection)
+
+    for name, ExternalManager in managers.items():
+        m = ExternalManager(connection=connection)
         log.info('populating %s at %s', name, m.engine.url)
 
         if delete_first:
@@ -101,6 +126,167 @@ def populate(debug, connection, delete_first):
         click.echo('populating {}'.format(name))
         m.populate()
 
+        click.echo('storing distributions of {}'.format(name))
+        store_distributions(compath_manager, m, get_database_date(name))
+
+
+def resources_option(help_text):
+    """Build the option of the resources of the precomputation commands.
+
+    :param str help_text: help of the option
+    """
+    return click.option('-r', '--resource', 'resources', multiple=True, default=SIMULATE_RESOURCES,
+                        show_default=True, help=help_text)
+
+
+def _check_resources_installed(resources):
+    """Exit if any of the given resources is not installed.
+
+    :param iter[str] resources: names of the resources
+    """
+    missing = [resource for resource in resources if resource not in managers]
+    if missing:
+        click.echo('Resources not installed: {}'.format(', '.join(missing)))
+        sys.exit(1)
+
+
+@main.command()
+@resources_option("Resources simulated. Every combination of at least two of them is simulated")
+@click.option('--max-threshold', type=int, default=SIMULATION_MAX_THRESHOLD, show_default=True,
+              help="Maximum number of shared genes that a pathway is required to contain")
+@click.option('--step', type=int, default=1, show_default=True, help="Step between two thresholds")
+@click.option('-n', '--null-size', 'null_sizes', type=click.IntRange(min=1), multiple=True, default=NULL_SIZES,
+              show_default=True, help="Sizes of the random gene sets of the null coverage simulation")
+@click.option('--runs', type=int, default=NULL_RUNS, show_default=True, help="Number of random gene sets of each size")
+@click.option('--seed', type=int, default=0, show_default=True, help="Seed of the null coverage simulation")
+@click.option('-o', '--output', default=SIMULATION_PATH, show_default=True, help="Output JSON file")
+@click.option('-w', '--workers', type=int, help="Number of processes. Defaults to the number of CPUs")
+@click.option('-v', '--debug', count=True, help="Turn on debugging.")
+@click.option('-c', '--connection', help="Defaults to {}".format(DEFAULT_CACHE_CONNECTION))
+def simulate(resources, max_threshold, step, null_sizes, runs, seed, output, workers, debug, connection):
+    """Precompute the pathway coverage simulation of combinations of resources and of random gene sets."""
+    set_debug_param(debug)
+
+    _check_resources_installed(resources)
+
+    resource_gene_sets = {}
+    database_date = {}
+
+    for resource in resources:
+        click.echo('loading gene sets of {}'.format(resource))
+        resource_gene_sets[resource] = query_gene_sets(managers[resource](connection=connection))
+        database_date[resource] = get_database_date(resource)
+
+    thresholds = range(1, max_threshold + 1, step)
+    combinations = get_combinations(resources)
+
+    click.echo('simulating {} combinations'.format(len(combinations)))
+    simulations = simulate_combinations(resource_gene_sets, combinations, thresholds=thresholds, max_workers=workers)
+
+    click.echo('simulating {} random gene sets of sizes {}'.format(runs, ', '.join(map(str, null_sizes))))
+    null_coverage = simulate_null_coverage(
+        resource_gene_sets,
+        load_gene_universe(connection=connection),
+        null_sizes,
+        thresholds=thresholds,
+        runs=runs,
+        seed=seed,
+        max_workers=workers,
+    )
+
+    save_simulations(output, simulations, thresholds, database_date=database_date, null_coverage=null_coverage)
+    click.echo('simulations saved to {}'.format(output))
+
+
+def _load_pathway_index(resources, connection=None):
+    """Load the pathways of the given resources from their databases or exit if one is not installed.
+
+    :param iter[str] resources: names of the resources
+    :param Optional[str] connection: database connection
+    :rtype: compath.pathway_index.PathwayIndex
+    """
+    _check_resources_installed(resources)
+
+    resource_gene_sets = {}
+    resource_distributions = {}
+
+    for resource in resources:
+        click.echo('loading gene sets of {}'.format(resource))
+        manager = managers[resource](connection=connection)
+        resource_gene_sets[resource] = query_gene_sets(manager)
+        resource_distributions[resource] = query_pathway_size_distribution(manager)
+
+    return PathwayIndex.from_gene_sets(resource_gene_sets, resource_distributions)
+
+
+@main.command()
+@resources_option("Resources whose pathways are clustered together")
+@click.option('-o', '--output', default=CLUSTERING_PATH, show_default=True, help="Output NumPy file")
+@click.option('-v', '--debug', count=True, help="Turn on debugging.")
+@click.option('-c', '--connection', help="Defaults to {}".format(DEFAULT_CACHE_CONNECTION))
+def cluster(resources, output, debug, connection):
+    """Precompute the hierarchical clustering of all the pathways of the resources."""
+    set_debug_param(debug)
+
+    pathway_index = _load_pathway_index(resources, connection)
+
+    try:
+        clustering = Clustering.from_pathway_index(
+            pathway_index,
+            resources,
+            database_date={resource: get_database_date(resource) for resource in resources},
+        )
+    except ValueError as e:
+        click.echo(str(e))
+        sys.exit(1)
+
+    clustering.save(output)
+    click.echo('clustering of {} pathways saved to {}'.format(len(clustering), output))
+
+
+@main.command()
+@resources_option("Resources in the network")
+@click.option('-s', '--min-similarity', type=float, default=LANDSCAPE_MIN_SIMILARITY, show_default=True,
+              help="Minimum similarity of the edges. Lower thresholds can not be served")
+@click.option('-o', '--output', default=LANDSCAPE_PATH, show_default=True, help="Output NumPy file")
+@click.option('-v', '--debug', count=True, help="Turn on debugging.")
+@click.option('-c', '--connection', help="Defaults to {}".format(DEFAULT_CACHE_CONNECTION))
+def landscape(resources, min_similarity, output, debug, connection):
+    """Precompute the similarity network of all the pathways of each pair of resources."""
+    set_debug_param(debug)
+
+    pathway_index = _load_pathway_index(resources, connection)
+
+    network = LandscapeNetwork.from_pathway_index(
+        pathway_index,
+        resources,
+        min_similarity=min_similarity,
+        database_date={resource: get_database_date(resource) for resource in resources},
+    )
+    network.save(output)
+    click.echo('landscape network of {} pathways saved to {}'.format(len(network.nodes), output))
+
+
+@main.command()
+@resources_option("Resources whose overlap matrix is built")
+@click.option('-d', '--directory', default=CLUSTERGRAMMER_DIR, show_default=True, help="Output directory")
+@click.option('-v', '--debug', count=True, help="Turn on debugging.")
+@click.option('-c', '--connection', help="Defaults to {}".format(DEFAULT_CACHE_CONNECTION))
+def clustergrammer(resources, directory, debug, connection):
+    """Build the Clustergrammer overlap matrix of the pathways of each resource."""
+    set_debug_param(debug)
+
+    _check_resources_installed(resources)
+
+    for resource in resources:
+        click.echo('building the overlap matrix of {}'.format(resource))
+        matrix = ClustergrammerMatrix.from_gene_sets(
+            query_gene_sets(managers[resource](connection=connection)),
+            database_date=get_database_date(resource),
+        )
+
+        click.echo('overlap matrix of {} pathways saved to {}'.format(len(matrix), matrix.save(directory, resource)))
+
 
 @main.command()
 @click.option('-v', '--debug', count=True, help="Turn on debugging.")
@@ -0,0 +1,343 @@
+# -*- coding: utf-8 -*-
+
+"""Hierarchical clustering of all the pathways of entire resources.
+
+The pathways are clustered like in the dendrogram of :mod:`compath.visualization.d3_dendrogram`: average linkage
+over the correlation distance between the rows of the Szymkiewicz-Simpson similarity matrix. The similarity matrix is
+calculated from the sparse incidence matrix and the correlation distances from the normalized rows, both in blocks of
+rows and in single precision. The memory still grows with the square of the number of pathways n: the dense similarity
+matrix takes 4n² bytes and the condensed distance matrix 2n² bytes, which SciPy converts to double precision (4n²
+bytes) to compute the linkage, so about 6n² bytes are needed at the peak (600 MB for 10,000 pathways). The linkage is
+computed offline with ``compath cluster`` and any of its subtrees or cuts is served by the web application.
+"""
+
+import json
+import logging
+import os
+import time
+
+import numpy as np
+import scipy.cluster.hierarchy
+
+from compath.incidence import IncidenceMatrix
+
+__all__ = [
+    'Clustering',
+    'calculate_correlation_distances',
+]
+
+log = logging.getLogger(__name__)
+
+#: Number of rows of the similarity and distance matrices computed at once
+BLOCK_SIZE = 512
+
+
+def calculate_correlation_distances(incidence_matrix, block_size=BLOCK_SIZE):
+    """Calculate the correlation distances between the rows of the similarity matrix of all pathways.
+
+    It gives the same distances as ``pdist(similarity_matrix, metric='correlation')`` in single precision.
+
+    :param compath.incidence.IncidenceMatrix incidence_matrix: incidence matrix
+    :param int block_size: number of rows computed at once
+    :rtype: tuple[numpy.ndarray,numpy.ndarray]
+    :return: condensed distance matrix of the kept pathways and boolean mask of the kept pathways. Pathways whose
+     similarities to all others are the same have no correlation distance and are removed from the rows and the
+     columns of the similarity matrix, as in the dendrogram of the selected pathways
+    """
+    keys = incidence_matrix.keys
+    n = len(keys)
+
+    similarities = np.empty((n, n), dtype=np.float32)
+
+    for start in range(0, n, block_size):
+        similarities[start:start + block_size] = incidence_matrix.szymkiewicz_simpson(
+            keys[start:start + block_size],
+            keys,
+        )
+
+    keep = ~np.all(similarities == similarities[:, :1], axis=1)
+    kept = np.flatnonzero(keep)
+    n = len(kept)
+
+    # Move the rows and columns of the kept pathways to the top left corner in place instead of copying them. The
+    # rows are moved up, so each block is written over rows that have already been moved or are not kept
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        similarities[start:stop, :n] = similarities[np.ix_(kept[start:stop], kept)]
+
+    normalized = similarities[:n, :n]
+
+    for start in range(0, n, block_size):
+        block = normalized[start:start + block_size]
+        block -= block.mean(axis=1, keepdims=True)
+
+        # Rows that became constant after removing the columns are at distance 1 from all the others
+        norms = np.linalg.norm(block, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        block /= norms
+
+    distances = np.empty(n * (n - 1) // 2, dtype=np.float32)
+
+    for start in range(0, n, block_size):
+        stop = min(start + block_size, n)
+        block = 1 - normalized[start:stop] @ normalized.T
+
+        # Copy the upper triangle of each row into the condensed matrix
+        for row in range(start, stop):
+            offset = row * n - row * (row + 1) // 2
+            distances[offset:offset + n - row - 1] = block[row - start, row + 1:]
+
+    np.clip(distances, 0, 2, out=distances)
+
+    return distances, keep
+
+
+class Clustering(object):
+    """Average linkage of the pathways of several resources."""
+
+    def __init__(self, linkage, resources, pathway_ids, pathway_names, database_date=None):
+        """Initialize the clustering.
+
+        :param numpy.ndarray linkage: SciPy linkage matrix
+        :param list[str] resources: resource of each leaf
+        :param list[str] pathway_ids: pathway identifier of each leaf
+        :param list[str] pathway_names: pathway name of each leaf
+        :param Optional[dict[str,str]] database_date: resource name to last populate date of the clustered pathways
+        """
+        self.linkage = linkage
+        self.resources = list(resources)
+        self.pathway_ids = list(pathway_ids)
+        self.pathway_names = list(pathway_names)
+        self.database_date = database_date
+
+    @classmethod
+    def from_pathway_index(cls, pathway_index, resources=None, block_size=BLOCK_SIZE, database_date=None):
+        """Cluster all the pathways of the given resources.
+
+        :param compath.pathway_index.PathwayIndex pathway_index: pathway index
+        :param Optional[iter[str]] resources: resources clustered. Defaults to all the resources in the index
+        :param int block_size: number of rows computed at once
+        :param Optional[dict[str,str]] database_date: resource name to last populate date of the clustered pathways
+        :rtype: Clustering
+        :raises ValueError: if fewer than two pathways can be clustered
+        """
+        resources = pathway_index.resources if resources is None else resources
+
+        gene_sets = {
+            (resource, pathway_id): gene_set
+            for resource in resources
+            for pathway_id, (_, gene_set) in pathway_index.pathways[resource].items()
+        }
+
+        log.info('Clustering %d pathways of %s', len(gene_sets), ', '.join(resources))
+        t = time.time()
+
+        distances, keep = calculate_correlation_distances(IncidenceMatrix(gene_sets), block_size=block_size)
+        keys = [key for key, kept in zip(gene_sets, keep) if kept]
+
+        if len(keys) < 2:
+            raise ValueError(
+                'Only {} of the {} pathways have a correlation distance to the others. At least 2 are needed to '
+                'cluster them'.format(len(keys), len(gene_sets))
+            )
+
+        linkage = scipy.cluster.hierarchy.linkage(distances, method='average')
+
+        log.info('Clustered %d pathways in %.2f seconds', len(keys), time.time() - t)
+
+        return cls(
+            linkage,
+            [resource for resource, _ in keys],
+            [pathway_id for _, pathway_id in keys],
+            [pathway_index.pathways[resource][pathway_id][0] for resource, pathway_id in keys],
+            database_date,
+        )
+
+    @classmethod
+    def load(cls, path):
+        """Load a clustering saved with :meth:`save`.
+
+        :param str path: path to the clustering
+        :rtype: Optional[Clustering]
+        :return: clustering or None if it does not exist or can not be read
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            data = np.load(path)
+
+            return cls(
+                data['linkage'],
+                data['resources'].tolist(),
+                data['pathway_ids'].tolist(),
+                data['pathway_names'].tolist(),
+                json.loads(str(data['database_date'])) if 'database_date' in data.files else None,
+            )
+
+        except Exception:
+            log.exception('Could not read clustering %s', path)
+            return None
+
+    def save(self, path):
+        """Save the clustering to a compressed NumPy file.
+
+        :param str path: output path (the .npz extension is added if it is missing)
+        """
+        np.savez_compressed(
+            path,
+            linkage=self.linkage,
+            resources=np.array(self.resources),
+            pathway_ids=np.array(self.pathway_ids),
+            pathway_names=np.array(self.pathway_names),
+            database_date=json.dumps(self.database_date),
+        )
+
+    def __len__(self):
+        """Return the number of clustered pathways."""
+        return len(self.pathway_ids)
+
+    @property
+    def root(self):
+        """Return the node identifier of the root.
+
+        :rtype: int
+        """
+        return 2 * len(self) - 2
+
+    def __contains__(self, node_id):
+        """Return if the node is in the tree."""
+        return 0 <= node_id <= self.root
+
+    def _get_leaf(self, node_id):
+        return dict(
+            node_id=node_id,
+            children=[],
+            name=self.pathway_names[node_id],
+            pathway_id=self.pathway_ids[node_id],
+            color=self.resources[node_id],
+            y=0,
+        )
+
+    def get_subtree(self, node_id=None, depth=None):
+        """Return the D3 tree of a node, with the same structure as the dendrogram of the selected pathways.
+
+        Nodes deeper than the given depth are returned without children and with the number of pathways they contain.
+
+        :param Optional[int] node_id: node identifier (the root if not given). Leaves are numbered from 0 and the
+         cluster created at the i-th step of the linkage is numbered with the number of pathways plus i
+        :param Optional[int] depth: maximum depth of the returned tree
+        :rtype: dict
+        """
+        node_id = self.root if node_id is None else node_id
+        n = len(self)
+
+        root = dict(node_id=node_id)
+        stack = [(root, 0)]
+
+        while stack:
+            node, node_depth = stack.pop()
+
+            if node['node_id'] < n:
+                node.update(self._get_leaf(node['node_id']))
+                continue
+
+            left, right, distance, size = self.linkage[node['node_id'] - n]
+            node['y'] = float(distance)
+
+            if depth is not None and node_depth >= depth:
+                node['children'] = []
+                node['size'] = int(size)
+                continue
+
+            node['children'] = [dict(node_id=int(left)), dict(node_id=int(right))]
+            stack.extend((child, node_depth + 1) for child in node['children'])
+
+        return root
+
+    def get_leaves(self, node_id):
+        """Return the leaves of a node.
+
+        :param int node_id: node identifier
+        :rtype: list[int]
+        """
+        n = len(self)
+        leaves = []
+        stack = [node_id]
+
+        while stack:
+            node_id = stack.pop()
+
+            if node_id < n:
+                leaves.append(node_id)
+                continue
+
+            left, right = self.linkage[node_id - n, :2]
+            stack.extend((int(right), int(left)))
+
+        return leaves
+
+    def cut(self, distance=None, clusters=None):
+        """Cut the tree at a distance or into a number of clusters.
+
+        :param Optional[float] distance: maximum distance between the pathways of a cluster
+        :param Optional[int] clusters: number of clusters (used if the distance is not given)
+        :rtype: list[dict]
+        :return: clusters, from the largest to the smallest, with their node identifier (which can be used to get
+         their subtree) and their pathways
+        """
+        if distance is not None:
+            node_ids = self._cut_at_distance(distance)
+        elif clusters is not None:
+            node_ids = self._cut_into_clusters(clusters)
+        else:
+            raise ValueError('either the distance or the number of clusters must be given')
+
+        result = [
+            dict(
+                node_id=node_id,
+                pathways=[
+                    dict(resource=self.resources[leaf], pathway_id=self.pathway_ids[leaf],
+                         name=self.pathway_names[leaf])
+                    for leaf in self.get_leaves(node_id)
+                ],
+            )
+            for node_id in node_ids
+        ]
+
+        return sorted(result, key=lambda cluster: len(cluster['pathways']), reverse=True)
+
+    def _cut_at_distance(self, distance):
+        """Return the highest nodes whose height is at most the given distance."""
+        n = len(self)
+        node_ids = []
+        stack = [self.root]
+
+        while stack:
+            node_id = stack.pop()
+
+            if node_id < n or self.linkage[node_id - n, 2] <= distance:
+                node_ids.append(node_id)
+                continue
+
+            stack.extend(int(child) for child in self.linkage[node_id - n, :2])
+
+        return node_ids
+
+    def _cut_into_clusters(self, clusters):
+        """Return the nodes obtained by undoing the last merges of the linkage."""
+        n = len(self)
+        clusters = max(1, min(clusters, n))
+
+        # The i-th merge creates node n + i, so the last k - 1 merges split the tree into k clusters
+        split = set(range(2 * n - clusters, 2 * n - 1))
+
+        return [
+            node_id
+            for node_id in [self.root] + [
+                int(child)
+                for node_id in split
+                for child in self.linkage[node_id - n, :2]
+            ]
+            if node_id not in split
+        ]
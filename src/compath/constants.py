@@ -12,6 +12,40 @@ MODULE_NAME = 'compath'
 DATA_DIR = get_data_dir(MODULE_NAME)
 DEFAULT_CACHE_CONNECTION = get_connection(MODULE_NAME)
 
+#: Name of the Bio2BEL HGNC module (used to check when the gene universe was populated)
+HGNC_MODULE_NAME = 'hgnc'
+
+#: Snapshot of the derived state of the web application
+SNAPSHOT_PATH = os.environ.get('COMPATH_SNAPSHOT_PATH', os.path.join(DATA_DIR, 'web_snapshot.pickle'))
+
+#: Coverage curves of the combinations of resources precomputed with ``compath simulate``
+SIMULATION_PATH = os.environ.get('COMPATH_SIMULATION_PATH', os.path.join(DATA_DIR, 'simulation.json'))
+
+#: Linkage of all the pathways of the resources precomputed with ``compath cluster``
+CLUSTERING_PATH = os.environ.get('COMPATH_CLUSTERING_PATH', os.path.join(DATA_DIR, 'clustering.npz'))
+
+#: Similarity network of all the pathways of each pair of resources precomputed with ``compath landscape``
+LANDSCAPE_PATH = os.environ.get('COMPATH_LANDSCAPE_PATH', os.path.join(DATA_DIR, 'landscape.npz'))
+#: Minimum similarity of the edges of the landscape network
+LANDSCAPE_MIN_SIMILARITY = 0.1
+
+#: Clustergrammer matrices of the resources precomputed with ``compath clustergrammer`` for each populate date
+CLUSTERGRAMMER_DIR = os.environ.get('COMPATH_CLUSTERGRAMMER_DIR', os.path.join(DATA_DIR, 'clustergrammer'))
+#: Number of pathways with the largest overlap shown by default in the Clustergrammer pages
+CLUSTERGRAMMER_TOP = 300
+
+#: Version of the snapshot format. Increase it every time the content of the snapshot changes
+SNAPSHOT_VERSION = 5
+
+#: Number of threads used to load the resources when the web application starts
+STARTUP_WORKERS = int(os.environ.get('COMPATH_STARTUP_WORKERS', 4))
+#: Seconds between two checks for repopulated resources in the web application
+REFRESH_INTERVAL = float(os.environ.get('COMPATH_REFRESH_INTERVAL', 60))
+#: Number of threads used to call the Bio2BEL managers of all resources concurrently in the web application
+FANOUT_WORKERS = int(os.environ.get('COMPATH_FANOUT_WORKERS', 8))
+#: Seconds each Bio2BEL manager is given to answer a call made to all resources
+PLUGIN_TIMEOUT = float(os.environ.get('COMPATH_PLUGIN_TIMEOUT', 5))
+
 SWAGGER_CONFIG = {
     'title': 'ComPath API',
     'description': 'Exposes the ComPath RESTful API',
@@ -69,6 +103,33 @@ REACTOME_URL = 'https://reactome.org/PathwayBrowser/#/{}'
 #: URL to pathways in WikiPathways
 WIKIPATHWAYS_URL = 'https://www.wikipathways.org/index.php/Pathway:{}'
 
+#: Resources compared in the simulation of pathway enrichment
+SIMULATE_RESOURCES = [KEGG, REACTOME, WIKIPATHWAYS]
+
+#: Maximum number of genes shared by the resources that a pathway is required to contain in the simulation
+SIMULATION_MAX_THRESHOLD = 199
+#: Sizes of the random gene sets of the null coverage simulation
+NULL_SIZES = [10, 50, 100, 500]
+#: Number of random gene sets of each size in the null coverage simulation
+NULL_RUNS = 1000
+#: Percentiles of the coverage of the random gene sets shown in the simulation page
+NULL_PERCENTILES = (5, 50, 95)
+#: Number of random gene sets drawn and intersected with the pathways at once
+NULL_BATCH_SIZE = 50
+
+#: Number of most similar pathways per resource suggested as mappings by content
+TOP_CONTENT_NEIGHBORS = 5
+
+#: Maximum number of sets of a Venn diagram for which the intersections of every combination of sets are calculated.
+#: Venn diagrams with more sets only show the intersections of the pairs of sets
+VENN_MAX_SETS = 5
+
+#: Suffix of the KEGG pathway names
+KEGG_SUFFIX = ' - Homo sapiens (human)'
+
+#: Maximum number of completions returned by the autocompletion endpoints
+AUTOCOMPLETION_TOP = 10
+
 #: Managers with hierarchical information
 HIERARCHY_MANAGERS = {REACTOME}
 
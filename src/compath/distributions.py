@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+
+"""Set-based queries for the pathway size distribution, gene distribution and gene sets of the ComPath resources.
+
+Instead of loading every pathway with its proteins as ORM objects, each function issues a single query over the
+protein/pathway association table of the Bio2BEL plugin and aggregates the rows in the database with GROUP BY.
+"""
+
+import logging
+from collections import defaultdict
+
+from sqlalchemy import distinct, func
+
+__all__ = [
+    'HUMAN',
+    'query_pathway_count',
+    'query_pathway_size_distribution',
+    'query_gene_distribution',
+    'query_gene_sets',
+    'load_distributions',
+    'store_distributions',
+]
+
+log = logging.getLogger(__name__)
+
+#: Species of the pathways used in ComPath for resources that contain several species (e.g., Reactome)
+HUMAN = 'Homo sapiens'
+
+
+def _get_association_table(manager):
+    """Return the protein/pathway association table of a Bio2BEL manager.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :rtype: Optional[sqlalchemy.Table]
+    :return: association table or None if the pathway model has no many to many relationship with the proteins
+    """
+    pathway_model = getattr(manager, 'pathway_model', None)
+    proteins = getattr(pathway_model, 'proteins', None)
+
+    if proteins is None:
+        return None
+
+    return getattr(proteins.property, 'secondary', None)
+
+
+def _filter_species(manager, query):
+    """Restrict a query over pathways to human pathways if the resource contains several species.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :param sqlalchemy.orm.Query query: query over the pathway model
+    :rtype: sqlalchemy.orm.Query
+    """
+    species = getattr(manager.pathway_model, 'species', None)
+
+    if species is None:
+        return query
+
+    species_model = species.property.mapper.class_
+
+    return query.join(species).filter(species_model.name == HUMAN)
+
+
+def query_pathway_count(manager):
+    """Return the number of pathways of a resource, including the ones without proteins.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :rtype: int
+    """
+    pathway_model = getattr(manager, 'pathway_model', None)
+
+    if pathway_model is None:
+        return manager.count_pathways()
+
+    query = manager.session.query(func.count(pathway_model.id))
+
+    return _filter_species(manager, query).scalar()
+
+
+def query_pathway_size_distribution(manager):
+    """Return the number of proteins in each non-empty pathway of a resource.
+
+    It has the same structure as :meth:`compath_utils.CompathManager.get_pathway_size_distribution`.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :rtype: dict[str,list]
+    :return: pathway identifier to [pathway name, number of proteins]
+    """
+    association_table = _get_association_table(manager)
+
+    if association_table is None:
+        return manager.get_pathway_size_distribution()
+
+    pathway_model = manager.pathway_model
+    # The identifier column is a class attribute, reading it from the instance would trigger the ORM descriptor
+    identifier_column = type(manager).pathway_model_identifier_column
+
+    query = manager.session.query(
+        identifier_column,
+        pathway_model.name,
+        func.count(distinct(association_table.c.protein_id)),
+    ).join(
+        association_table, association_table.c.pathway_id == pathway_model.id
+    )
+
+    query = _filter_species(manager, query).group_by(pathway_model.id)
+
+    return {
+        pathway_id: [pathway_name, size]
+        for pathway_id, pathway_name, size in query
+    }
+
+
+def query_gene_distribution(manager):
+    """Return the number of pathways each HGNC symbol is part of in a resource.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :rtype: dict[str,int]
+    """
+    association_table = _get_association_table(manager)
+
+    if association_table is None:
+        return dict(manager.get_gene_distribution())
+
+    protein_model = manager.protein_model
+    hgnc_symbol = protein_model.hgnc_symbol
+
+    query = manager.session.query(
+        hgnc_symbol,
+        func.count(distinct(association_table.c.pathway_id)),
+    ).join(
+        association_table, association_table.c.protein_id == protein_model.id
+    ).filter(
+        hgnc_symbol.isnot(None)
+    ).group_by(
+        hgnc_symbol
+    )
+
+    return dict(query)
+
+
+def query_gene_sets(manager):
+    """Return the HGNC symbols in each pathway of a resource.
+
+    It has the same structure as :meth:`compath_utils.CompathManager.export_gene_sets`. Pathways without any HGNC
+    symbol are left out, as in the Reactome manager, so they are not taken into account in the overlaps, clusterings and
+    simulations.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :rtype: dict[str,set[str]]
+    """
+    association_table = _get_association_table(manager)
+
+    if association_table is None:
+        return manager.export_gene_sets()
+
+    pathway_model = manager.pathway_model
+    protein_model = manager.protein_model
+
+    query = manager.session.query(
+        pathway_model.name,
+        protein_model.hgnc_symbol,
+    ).join(
+        association_table, association_table.c.pathway_id == pathway_model.id
+    ).join(
+        protein_model, association_table.c.protein_id == protein_model.id
+    )
+
+    gene_sets = defaultdict(set)
+
+    for pathway_name, hgnc_symbol in _filter_species(manager, query):
+        if hgnc_symbol:
+            gene_sets[pathway_name].add(hgnc_symbol)
+
+    return dict(gene_sets)
+
+
+def load_distributions(manager, compath_manager=None, database_date=None):
+    """Return the pathway size and gene distributions of a resource.
+
+    They are read from the distribution table of ComPath if they were stored for the given populate date and
+    computed from the database of the resource otherwise.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :param Optional[compath.manager.Manager] compath_manager: ComPath manager
+    :param Optional[str] database_date: date the resource was last populated
+    :rtype: tuple[dict[str,list],dict[str,int]]
+    """
+    if compath_manager is not None and database_date is not None:
+        distributions = compath_manager.get_distributions(manager.module_name, database_date)
+
+        if distributions is not None:
+            log.info('Using stored distributions for %s', manager.module_name)
+            return distributions
+
+    return query_pathway_size_distribution(manager), query_gene_distribution(manager)
+
+
+def store_distributions(compath_manager, manager, database_date):
+    """Compute the pathway size and gene distributions of a resource and store them in ComPath.
+
+    :param compath.manager.Manager compath_manager: ComPath manager
+    :param compath_utils.CompathManager manager: Bio2BEL manager
+    :param str database_date: date the resource was populated
+    """
+    compath_manager.store_distributions(
+        manager.module_name,
+        database_date,
+        query_pathway_size_distribution(manager),
+        query_gene_distribution(manager),
+    )
@@ -0,0 +1,141 @@
+# -*- coding: utf-8 -*-
+
+"""Concurrent calls to the Bio2BEL managers of all the resources, each one with a deadline.
+
+A slow or broken plugin must not block the whole response, so the calls are submitted to a thread pool and the
+results that are not ready before the deadline are reported as timed out instead of being waited for. Concurrent
+requests share the calls of the same function that are still running instead of submitting new ones. Running calls can
+not be cancelled, so a resource whose call has run past its deadline is not called again until that call finishes.
+Otherwise, a plugin that hangs would take a new thread of the pool at every request until none is left for the other
+resources.
+"""
+
+import logging
+import time
+import weakref
+from concurrent.futures import wait
+from threading import Lock
+
+from compath.constants import BLACK_LIST, PLUGIN_TIMEOUT
+
+__all__ = [
+    'TIMEOUT',
+    'fan_out',
+]
+
+log = logging.getLogger(__name__)
+
+#: Error reported for the resources that did not answer before the deadline
+TIMEOUT = 'timeout'
+
+#: Executor to resource name to call key to the future and the deadline of the calls that may still be running
+_running_calls = weakref.WeakKeyDictionary()
+_running_calls_lock = Lock()
+
+
+def _call(function, resource_name, manager):
+    """Call the function with a manager and release the database session used by the worker thread."""
+    try:
+        return function(resource_name, manager)
+    finally:
+        session = getattr(manager, 'session', None)
+
+        # Scoped sessions create one session per thread, which is not closed by the Flask teardown of the request
+        if hasattr(session, 'remove'):
+            session.remove()
+
+
+def _get_call_key(function):
+    """Return the key under which the running calls of a function are shared.
+
+    The views pass lambdas, which are new objects at every request but share their code.
+    """
+    return getattr(function, '__code__', function)
+
+
+def _get_running_call(executor, function, resource_name, manager, deadline):
+    """Return the running call of the function to a resource or submit a new one.
+
+    Must be called with the lock of the running calls held.
+
+    :param concurrent.futures.Executor executor: executor running the calls
+    :param callable function: function called with the name of the resource and its manager
+    :param str resource_name: name of the resource
+    :param compath_utils.CompathManager manager: manager of the resource
+    :param float deadline: time until which a new call is given to answer
+    :rtype: Optional[concurrent.futures.Future]
+    :return: future of the call or None if the resource has a call that ran past its deadline
+    """
+    resource_calls = _running_calls.setdefault(executor, {}).setdefault(resource_name, {})
+    now = time.time()
+
+    for key, (future, call_deadline) in list(resource_calls.items()):
+        if future.done():
+            del resource_calls[key]
+        elif call_deadline < now:
+            return None
+
+    call_key = _get_call_key(function)
+
+    if call_key not in resource_calls:
+        resource_calls[call_key] = executor.submit(_call, function, resource_name, manager), deadline
+
+    return resource_calls[call_key][0]
+
+
+def fan_out(executor, manager_dict, function, timeout=PLUGIN_TIMEOUT, skip_black_list=True):
+    """Call a function with each manager concurrently.
+
+    The calls that do not finish before the deadline keep running in the background, but their results are ignored.
+    A call of the same function to a resource that is still running in the same executor is waited for instead of
+    submitting a new one. The resources with a call that has run past its deadline are not called and reported as timed
+    out until that call finishes.
+
+    :param concurrent.futures.Executor executor: executor running the calls
+    :param dict[str,compath_utils.CompathManager] manager_dict: manager name to manager instances dictionary
+    :param callable function: function called with the name of the resource and its manager
+    :param float timeout: seconds given to each resource
+    :param bool skip_black_list: skip the resources in :data:`compath.constants.BLACK_LIST`
+    :rtype: tuple[dict[str,Any],dict[str,str]]
+    :return: resource name to result for the calls that succeeded and resource name to error ('timeout' or the error
+     message) for the others
+    """
+    t = time.time()
+
+    futures = {}
+    errors = {}
+
+    with _running_calls_lock:
+        for resource_name, manager in manager_dict.items():
+            if skip_black_list and resource_name in BLACK_LIST:
+                continue
+
+            future = _get_running_call(executor, function, resource_name, manager, t + timeout)
+
+            if future is None:
+                log.warning('%s is still answering a call that ran past its deadline', resource_name)
+                errors[resource_name] = TIMEOUT
+                continue
+
+            futures[resource_name] = future
+
+    # All calls start at the same time, so waiting for all of them is the same as a deadline per resource
+    wait(futures.values(), timeout=timeout)
+
+    results = {}
+
+    for resource_name, future in futures.items():
+        if not future.done():
+            log.warning('%s did not answer in %.2f seconds', resource_name, timeout)
+            errors[resource_name] = TIMEOUT
+            continue
+
+        try:
+            results[resource_name] = future.result()
+        except Exception as e:
+            log.exception('%s failed', resource_name)
+            errors[resource_name] = str(e)
+
+    log.debug('Fanned out to %d resources in %.2f seconds', len(futures), time.time() - t)
+
+    return results, errors
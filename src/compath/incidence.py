@@ -0,0 +1,194 @@
+# -*- coding: utf-8 -*-
+
+"""Sparse pathway x gene incidence matrix used to compute overlaps between many pathways at once.
+
+Each row of the matrix is a pathway (identified by any hashable key, usually a (resource, pathway id) tuple) and each
+column a HGNC symbol. Intersection sizes between all pairs of rows are obtained with a single sparse matrix product,
+from which union sizes and the Szymkiewicz-Simpson and Jaccard coefficients are derived.
+"""
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+__all__ = [
+    'IncidenceMatrix',
+]
+
+
+def _safe_divide(numerator, denominator):
+    """Divide two arrays element-wise returning 0 where the denominator is 0.
+
+    :param numpy.ndarray numerator:
+    :param numpy.ndarray denominator:
+    :rtype: numpy.ndarray
+    """
+    result = np.zeros(np.broadcast(numerator, denominator).shape, dtype=np.float64)
+    np.divide(numerator, denominator, out=result, where=denominator != 0)
+    return result
+
+
+class IncidenceMatrix(object):
+    """Binary CSR matrix with pathways as rows and HGNC symbols as columns."""
+
+    def __init__(self, gene_sets):
+        """Build the incidence matrix.
+
+        :param dict[Hashable,set[str]] gene_sets: pathway key to gene set (rows keep the order of the dictionary)
+        """
+        self.keys = list(gene_sets)
+        self.key_to_row = {
+            key: row
+            for row, key in enumerate(self.keys)
+        }
+
+        self.genes = sorted({
+            gene
+            for gene_set in gene_sets.values()
+            for gene in gene_set
+        })
+        self.gene_to_column = {
+            gene: column
+            for column, gene in enumerate(self.genes)
+        }
+
+        indptr = [0]
+        indices = []
+
+        for key in self.keys:
+            indices.extend(sorted(self.gene_to_column[gene] for gene in gene_sets[key]))
+            indptr.append(len(indices))
+
+        self.matrix = csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), np.array(indices, dtype=np.int32), np.array(indptr)),
+            shape=(len(self.keys), len(self.genes)),
+        )
+
+        #: number of genes in each row
+        self.sizes = np.diff(self.matrix.indptr)
+
+    @classmethod
+    def from_pathway_index(cls, pathway_index):
+        """Build the incidence matrix of all pathways in a pathway index, keyed by (resource, pathway id).
+
+        :param compath.pathway_index.PathwayIndex pathway_index: pathway index
+        :rtype: IncidenceMatrix
+        """
+        return cls({
+            (resource, pathway_id): gene_set
+            for resource, pathways in pathway_index.pathways.items()
+            for pathway_id, (_, gene_set) in pathways.items()
+        })
+
+    def __len__(self):
+        """Return the number of pathways in the matrix."""
+        return len(self.keys)
+
+    def __contains__(self, key):
+        """Return if the pathway is in the matrix."""
+        return key in self.key_to_row
+
+    def get_rows(self, keys=None):
+        """Return the row indexes of the given pathways (all pathways if not given).
+
+        :param Optional[iter] keys: pathway keys
+        :rtype: numpy.ndarray
+        """
+        if keys is None:
+            return np.arange(len(self.keys))
+
+        return np.array([self.key_to_row[key] for key in keys], dtype=np.int64)
+
+    def vectorize_gene_set(self, gene_set):
+        """Encode a gene set as a 1 x genes sparse row. Genes not in the matrix are ignored.
+
+        :param iter[str] gene_set: HGNC symbols
+        :rtype: scipy.sparse.csr_matrix
+        """
+        columns = sorted({
+            self.gene_to_column[gene]
+            for gene in gene_set
+            if gene in self.gene_to_column
+        })
+
+        return csr_matrix(
+            (np.ones(len(columns), dtype=np.int32), np.array(columns, dtype=np.int32), np.array([0, len(columns)])),
+            shape=(1, len(self.genes)),
+        )
+
+    def intersections(self, keys_1=None, keys_2=None):
+        """Calculate the intersection sizes between two groups of pathways.
+
+        :param Optional[iter] keys_1: pathway keys of the rows (all pathways if not given)
+        :param Optional[iter] keys_2: pathway keys of the columns (same as keys_1 if not given)
+        :rtype: numpy.ndarray
+        :return: len(keys_1) x len(keys_2) matrix
+        """
+        rows_1 = self.get_rows(keys_1)
+        rows_2 = rows_1 if keys_2 is None else self.get_rows(keys_2)
+
+        return self._intersections(rows_1, rows_2)
+
+    def _intersections(self, rows_1, rows_2):
+        sub_matrix_1 = self.matrix[rows_1]
+        sub_matrix_2 = sub_matrix_1 if rows_2 is rows_1 else self.matrix[rows_2]
+
+        return (sub_matrix_1 @ sub_matrix_2.T).toarray()
+
+    def unions(self, keys_1=None, keys_2=None):
+        """Calculate the union sizes between two groups of pathways.
+
+        :param Optional[iter] keys_1: pathway keys of the rows (all pathways if not given)
+        :param Optional[iter] keys_2: pathway keys of the columns (same as keys_1 if not given)
+        :rtype: numpy.ndarray
+        """
+        rows_1 = self.get_rows(keys_1)
+        rows_2 = rows_1 if keys_2 is None else self.get_rows(keys_2)
+
+        return self._unions(rows_1, rows_2, self._intersections(rows_1, rows_2))
+
+    def _unions(self, rows_1, rows_2, intersections):
+        return self.sizes[rows_1][:, np.newaxis] + self.sizes[rows_2][np.newaxis, :] - intersections
+
+    def szymkiewicz_simpson(self, keys_1=None, keys_2=None):
+        """Calculate the Szymkiewicz-Simpson coefficients between two groups of pathways.
+
+        :param Optional[iter] keys_1: pathway keys of the rows (all pathways if not given)
+        :param Optional[iter] keys_2: pathway keys of the columns (same as keys_1 if not given)
+        :rtype: numpy.ndarray
+        """
+        rows_1 = self.get_rows(keys_1)
+        rows_2 = rows_1 if keys_2 is None else self.get_rows(keys_2)
+
+        smaller_sets = np.minimum(self.sizes[rows_1][:, np.newaxis], self.sizes[rows_2][np.newaxis, :])
+
+        return _safe_divide(self._intersections(rows_1, rows_2), smaller_sets)
+
+    def jaccard(self, keys_1=None, keys_2=None):
+        """Calculate the Jaccard indexes between two groups of pathways.
+
+        :param Optional[iter] keys_1: pathway keys of the rows (all pathways if not given)
+        :param Optional[iter] keys_2: pathway keys of the columns (same as keys_1 if not given)
+        :rtype: numpy.ndarray
+        """
+        rows_1 = self.get_rows(keys_1)
+        rows_2 = rows_1 if keys_2 is None else self.get_rows(keys_2)
+
+        intersections = self._intersections(rows_1, rows_2)
+
+        return _safe_divide(intersections, self._unions(rows_1, rows_2, intersections))
+
+    def intersections_with_gene_set(self, gene_set):
+        """Calculate the intersection sizes between a gene set and every pathway.
+
+        :param iter[str] gene_set: HGNC symbols
+        :rtype: numpy.ndarray
+        """
+        return (self.matrix @ self.vectorize_gene_set(gene_set).T).toarray().ravel()
+
+    def szymkiewicz_simpson_with_gene_set(self, gene_set):
+        """Calculate the Szymkiewicz-Simpson coefficients between a gene set and every pathway.
+
+        :param set[str] gene_set: HGNC symbols
+        :rtype: numpy.ndarray
+        """
+        return _safe_divide(self.intersections_with_gene_set(gene_set), np.minimum(self.sizes, len(gene_set)))
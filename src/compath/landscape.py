@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+
+"""Similarity network of the whole landscape of pathways of each pair of resources.
+
+For every pair of resources (including a resource with itself), the edges between their pathways with at least a
+minimum similarity are kept in a single list sorted by decreasing similarity, so the network for any higher threshold
+is the prefix of that list found with a binary search. The edge lists are computed from the database with
+``compath landscape`` and served by the web application.
+"""
+
+import itertools as itt
+import json
+import logging
+import os
+import time
+
+import numpy as np
+
+from compath.constants import LANDSCAPE_MIN_SIMILARITY
+from compath.incidence import IncidenceMatrix
+from compath.visualization.cytoscape import _get_node_data
+
+__all__ = [
+    'LandscapeNetwork',
+]
+
+log = logging.getLogger(__name__)
+
+#: Number of rows of the similarity matrix computed at once
+BLOCK_SIZE = 512
+
+
+def _get_pair(resource_1, resource_2):
+    """Return the pair of resources in alphabetical order.
+
+    :rtype: tuple[str,str]
+    """
+    return tuple(sorted((resource_1, resource_2)))
+
+
+class LandscapeNetwork(object):
+    """Edges between the pathways of each pair of resources sorted by decreasing similarity."""
+
+    def __init__(self, nodes, edges, min_similarity, database_date=None):
+        """Initialize the network.
+
+        :param list[tuple[str,str,str]] nodes: resource, pathway identifier and pathway name of each node
+        :param dict[tuple[str,str],tuple[numpy.ndarray,numpy.ndarray,numpy.ndarray]] edges: pair of resources in
+         alphabetical order to the sources, targets and similarities of its edges sorted by decreasing similarity
+        :param float min_similarity: minimum similarity of the edges
+        :param Optional[dict[str,str]] database_date: resource name to last populate date of the pathways
+        """
+        self.nodes = nodes
+        self.edges = edges
+        self.min_similarity = min_similarity
+        self.database_date = database_date
+
+    @classmethod
+    def from_pathway_index(cls, pathway_index, resources=None, min_similarity=LANDSCAPE_MIN_SIMILARITY, block_size=BLOCK_SIZE,
+                           database_date=None):
+        """Calculate the edges between the pathways of every pair of resources.
+
+        :param compath.pathway_index.PathwayIndex pathway_index: pathway index
+        :param Optional[iter[str]] resources: resources in the network. Defaults to all the resources in the index
+        :param float min_similarity: minimum similarity of the edges
+        :param int block_size: number of rows of the similarity matrix computed at once
+        :param Optional[dict[str,str]] database_date: resource name to last populate date of the pathways
+        :rtype: LandscapeNetwork
+        """
+        resources = sorted(pathway_index.resources if resources is None else resources)
+
+        incidence_matrix = IncidenceMatrix({
+            (resource, pathway_id, pathway_name): gene_set
+            for resource in resources
+            for pathway_id, (pathway_name, gene_set) in pathway_index.pathways[resource].items()
+        })
+
+        resource_rows = {
+            resource: np.array(
+                [row for row, key in enumerate(incidence_matrix.keys) if key[0] == resource],
+                dtype=np.int64,
+            )
+            for resource in resources
+        }
+
+        edges = {}
+
+        for resource_1, resource_2 in itt.combinations_with_replacement(resources, 2):
+            t = time.time()
+
+            rows_1, rows_2 = resource_rows[resource_1], resource_rows[resource_2]
+            sources, targets, similarities = [], [], []
+
+            for start in range(0, len(rows_1), block_size):
+                block_rows = rows_1[start:start + block_size]
+                block = incidence_matrix.szymkiewicz_simpson(
+                    [incidence_matrix.keys[row] for row in block_rows],
+                    [incidence_matrix.keys[row] for row in rows_2],
+                )
+
+                qualifying = block >= min_similarity
+
+                # Each pair of pathways of the same resource is only linked once and pathways are not linked to
+                # themselves
+                if resource_1 == resource_2:
+                    qualifying &= block_rows[:, np.newaxis] < rows_2[np.newaxis, :]
+
+                block_sources, block_targets = np.nonzero(qualifying)
+
+                sources.append(block_rows[block_sources])
+                targets.append(rows_2[block_targets])
+                similarities.append(block[block_sources, block_targets])
+
+            sources = np.concatenate(sources) if sources else np.array([], dtype=np.int64)
+            targets = np.concatenate(targets) if targets else np.array([], dtype=np.int64)
+            similarities = np.concatenate(similarities) if similarities else np.array([], dtype=np.float64)
+
+            order = np.argsort(-similarities, kind='stable')
+
+            edges[resource_1, resource_2] = sources[order], targets[order], similarities[order]
+
+            log.info('Calculated %d edges between %s and %s in %.2f seconds', len(order), resource_1, resource_2,
+                     time.time() - t)
+
+        return cls(list(incidence_matrix.keys), edges, min_similarity, database_date)
+
+    @classmethod
+    def load(cls, path):
+        """Load a network saved with :meth:`save`.
+
+        :param str path: path to the network
+        :rtype: Optional[LandscapeNetwork]
+        :return: network or None if it does not exist or can not be read
+        """
+        if not os.path.exists(path):
+            return None
+
+        try:
+            data = np.load(path)
+
+            offsets = data['offsets']
+
+            edges = {
+                (resource_1, resource_2): (
+                    data['sources'][start:stop],
+                    data['targets'][start:stop],
+                    data['similarities'][start:stop],
+                )
+                for (resource_1, resource_2), start, stop in zip(data['pairs'].tolist(), offsets[:-1], offsets[1:])
+            }
+
+            return cls(
+                [tuple(node) for node in data['nodes'].tolist()],
+                edges,
+                float(data['min_similarity']),
+                json.loads(str(data['database_date'])) if 'database_date' in data.files else None,
+            )
+
+        except Exception:
+            log.exception('Could not read landscape network %s', path)
+            return None
+
+    def save(self, path):
+        """Save the network to a compressed NumPy file.
+
+        :param str path: output path (the .npz extension is added if it is missing)
+        """
+        pairs = list(self.edges)
+
+        np.savez_compressed(
+            path,
+            nodes=np.array(self.nodes).reshape(-1, 3),
+            pairs=np.array(pairs).reshape(-1, 2),
+            offsets=np.cumsum([0] + [len(self.edges[pair][0]) for pair in pairs]),
+            sources=np.concatenate([self.edges[pair][0] for pair in pairs]),
+            targets=np.concatenate([self.edges[pair][1] for pair in pairs]),
+            similarities=np.concatenate([self.edges[pair][2] for pair in pairs]),
+            min_similarity=self.min_similarity,
+            database_date=json.dumps(self.database_date),
+        )
+
+    def __contains__(self, pair):
+        """Return if the network has the edges of a pair of resources."""
+        return _get_pair(*pair) in self.edges
+
+    def count_edges(self, resource_1, resource_2, min_similarity):
+        """Return the number of edges with at least the given similarity between two resources.
+
+        :param str resource_1: name of the first resource
+        :param str resource_2: name of the second resource
+        :param float min_similarity: minimum similarity
+        :rtype: int
+        """
+        similarities = self.edges[_get_pair(resource_1, resource_2)][2]
+
+        # The similarities are sorted in decreasing order
+        return int(np.searchsorted(-similarities, -min_similarity, side='right'))
+
+    def get_network(self, resource_1, resource_2, min_similarity):
+        """Return the Cytoscape.js network of two resources with the edges with at least the given similarity.
+
+        Only the pathways linked by at least one edge are included.
+
+        :param str resource_1: name of the first resource
+        :param str resource_2: name of the second resource
+        :param float min_similarity: minimum similarity. It can not be lower than the minimum similarity of the network
+        :rtype: dict
+        """
+        sources, targets, similarities = self.edges[_get_pair(resource_1, resource_2)]
+        number_of_edges = self.count_edges(resource_1, resource_2, min_similarity)
+
+        sources, targets = sources[:number_of_edges], targets[:number_of_edges]
+        similarities = similarities[:number_of_edges]
+
+        rows = np.unique(np.concatenate([sources, targets]))
+
+        return {
+            'nodes': [
+                {'data': _get_node_data(node_id, self.nodes[row])}
+                for node_id, row in enumerate(rows.tolist())
+            ],
+            'edges': [
+                {'data': {'source': source, 'target': target, 'similarity': similarity}}
+                for source, target, similarity in zip(
+                    np.searchsorted(rows, sources).tolist(),
+                    np.searchsorted(rows, targets).tolist(),
+                    similarities.tolist(),
+                )
+            ],
+        }
@@ -4,15 +4,19 @@
 
 import datetime
 import logging
+from collections import OrderedDict
 from typing import List, Optional
 
-from sqlalchemy import and_, create_engine
+from sqlalchemy import MetaData, Table, and_, bindparam, create_engine, func, inspect, select, sql
 from sqlalchemy.orm import scoped_session, sessionmaker
 
 from bio2bel.utils import get_connection
 from . import managers
 from .constants import EQUIVALENT_TO, IS_PART_OF, MAPPING_TYPES, MODULE_NAME
-from .models import Base, PathwayMapping, User, Vote, mappings_users
+from .models import (
+    Base, DistributionEntry, GENE_DISTRIBUTION, MAPPING_TABLE_NAME, PATHWAY_SIZE_DISTRIBUTION, PathwayMapping,
+    PathwayReference, User, Vote, mappings_users,
+)
 
 __all__ = [
     'Manager'
@@ -20,6 +24,15 @@ __all__ = [
 
 log = logging.getLogger(__name__)
 
+#: Columns of the counters of the mappings
+MAPPING_COUNT_COLUMNS = ['up_vote_count', 'down_vote_count', 'creator_count']
+
+#: Columns of the pathways of the mappings in the databases created before the pathway reference table
+LEGACY_MAPPING_COLUMNS = [
+    'service_1_name', 'service_1_pathway_id', 'service_1_pathway_name',
+    'service_2_name', 'service_2_pathway_id', 'service_2_pathway_name',
+]
+
 
 def _flip_service_order(service_1_name: str, service_2_name: str) -> bool:
     """Decide whether the service order should be flipped (true if they should be).
@@ -33,6 +46,17 @@ def _flip_service_order(service_1_name: str, service_2_name: str) -> bool:
     return service_1_name > service_2_name
 
 
+def _increment_vote_count(mapping: PathwayMapping, vote_type: bool, increment: int):
+    """Increment the counter of the up or down votes of a mapping.
+
+    The counter is incremented by the database when the mapping is flushed, so concurrent votes are not lost.
+    """
+    if vote_type:
+        mapping.up_vote_count = PathwayMapping.up_vote_count + increment
+    else:
+        mapping.down_vote_count = PathwayMapping.down_vote_count + increment
+
+
 def _ensure_manager(name):
     if name not in managers:
         raise ValueError('Manager does not exist for {}. Available: {}'.format(name, managers))
@@ -41,11 +65,20 @@ def _ensure_manager(name):
 class Manager(object):
     """Database manager."""
 
-    def __init__(self, engine, session):
-        """Init ComPath manager."""
+    def __init__(self, engine, session, create_all: bool = True):
+        """Init ComPath manager.
+
+        :param create_all: create and upgrade the tables. Managers that only use the session of a database already set
+         up by another manager should skip it
+        """
         self.engine = engine
         self.session = session
-        self.create_all()
+
+        #: Service name, pathway id and pathway name to the identifier in the pathway reference table
+        self.pathway_reference_ids = {}
+
+        if create_all:
+            self.create_all()
 
     @staticmethod
     def from_connection(connection=None):
@@ -59,10 +92,196 @@ class Manager(object):
     def create_all(self, check_first: bool = True):
         """Create tables for ComPath."""
         Base.metadata.create_all(self.engine, checkfirst=check_first)
+        self.upgrade_pathway_references()
+        self.upgrade_mapping_counts()
+        self.create_missing_indexes()
+
+    def upgrade_pathway_references(self) -> int:
+        """Move the pathways of the mappings of a database created by a previous version of ComPath to their table.
+
+        The mappings used to store the service name, pathway id and pathway name of their two pathways. These are
+        inserted in the pathway reference table and the mappings reference them. The old columns are dropped if the
+        database supports it. It can be run several times.
+
+        :return: number of upgraded mappings
+        """
+        inspector = inspect(self.engine)
+
+        if MAPPING_TABLE_NAME not in inspector.get_table_names():
+            return 0
+
+        column_names = {column['name'] for column in inspector.get_columns(MAPPING_TABLE_NAME)}
+
+        if 'reference_1_id' in column_names:
+            return 0
+
+        legacy_table = Table(MAPPING_TABLE_NAME, MetaData(), autoload=True, autoload_with=self.engine)
+        reference_table = PathwayReference.__table__
+
+        with self.engine.begin() as connection:
+            for side in ('reference_1_id', 'reference_2_id'):
+                connection.execute('ALTER TABLE {} ADD COLUMN {} INTEGER REFERENCES {}(id)'.format(
+                    MAPPING_TABLE_NAME, side, reference_table.name,
+                ))
+
+            rows = connection.execute(select(
+                [legacy_table.c.id] + [legacy_table.c[column_name] for column_name in LEGACY_MAPPING_COLUMNS]
+            )).fetchall()
+
+            pathways = sorted(
+                {tuple(row[1:4]) for row in rows} | {tuple(row[4:7]) for row in rows}
+            )
+
+            if pathways:
+                connection.execute(reference_table.insert(), [
+                    dict(resource=resource, pathway_id=pathway_id, name=name)
+                    for resource, pathway_id, name in pathways
+                ])
+
+            reference_ids = {
+                (resource, pathway_id, name): reference_id
+                for reference_id, resource, pathway_id, name in connection.execute(select([
+                    reference_table.c.id, reference_table.c.resource, reference_table.c.pathway_id,
+                    reference_table.c.name,
+                ]))
+            }
+
+            mapping_table = sql.table(
+                MAPPING_TABLE_NAME, sql.column('id'), sql.column('reference_1_id'), sql.column('reference_2_id'),
+            )
+
+            if rows:
+                connection.execute(
+                    mapping_table.update().where(mapping_table.c.id == bindparam('mapping_id')).values(
+                        reference_1_id=bindparam('pathway_1'),
+                        reference_2_id=bindparam('pathway_2'),
+                    ),
+                    [
+                        dict(
+                            mapping_id=row[0],
+                            pathway_1=reference_ids[tuple(row[1:4])],
+                            pathway_2=reference_ids[tuple(row[4:7])],
+                        )
+                        for row in rows
+                    ]
+                )
+
+            # The indexes of the old columns have to be dropped before the columns
+            for index in legacy_table.indexes:
+                index.drop(connection)
+
+            if self.engine.dialect.name != 'sqlite' or self.engine.dialect.server_version_info >= (3, 35, 0):
+                for column_name in LEGACY_MAPPING_COLUMNS:
+                    connection.execute('ALTER TABLE {} DROP COLUMN {}'.format(MAPPING_TABLE_NAME, column_name))
+
+        log.info('moved the pathways of %d mappings to the pathway reference table', len(rows))
+
+        return len(rows)
+
+    def upgrade_mapping_counts(self) -> bool:
+        """Add the counters of the votes and creators to the mappings of a database created by a previous version of ComPath.
+
+        The counters are filled from the votes and creators of the mappings. It can be run several times.
+
+        :return: if the counters were added
+        """
+        inspector = inspect(self.engine)
+
+        if MAPPING_TABLE_NAME not in inspector.get_table_names():
+            return False
+
+        column_names = {column['name'] for column in inspector.get_columns(MAPPING_TABLE_NAME)}
+
+        missing_columns = [
+            column_name
+            for column_name in MAPPING_COUNT_COLUMNS
+            if column_name not in column_names
+        ]
+
+        if not missing_columns:
+            return False
+
+        with self.engine.begin() as connection:
+            for column_name in missing_columns:
+                connection.execute('ALTER TABLE {} ADD COLUMN {} INTEGER NOT NULL DEFAULT 0'.format(
+                    MAPPING_TABLE_NAME, column_name,
+                ))
+
+            connection.execute(self._get_update_mapping_counts())
+
+        log.info('added the counters of votes and creators to the mappings')
+
+        return True
+
+    @staticmethod
+    def _get_update_mapping_counts(mapping_ids=None):
+        """Return the statement that recounts the votes and creators of the mappings.
+
+        :param Optional[list[int]] mapping_ids: identifiers of the mappings. Defaults to all mappings
+        """
+        mapping_table = PathwayMapping.__table__
+        vote_table = Vote.__table__
+
+        def count_votes(vote_type):
+            return select([func.count()]).where(and_(
+                vote_table.c.mapping_id == mapping_table.c.id,
+                vote_table.c.type == vote_type,
+            )).as_scalar()
+
+        statement = mapping_table.update().values(
+            up_vote_count=count_votes(True),
+            down_vote_count=count_votes(False),
+            creator_count=select([func.count()]).where(
+                mappings_users.c.mapping_id == mapping_table.c.id
+            ).as_scalar(),
+        )
+
+        if mapping_ids is not None:
+            statement = statement.where(mapping_table.c.id.in_(mapping_ids))
+
+        return statement
+
+    def update_mapping_counts(self, mapping_ids=None):
+        """Recount the votes and creators of the mappings, for changes not made through the manager.
+
+        :param Optional[list[int]] mapping_ids: identifiers of the mappings. Defaults to all mappings
+        """
+        self.session.execute(self._get_update_mapping_counts(mapping_ids))
+        self.session.commit()
+        self.session.expire_all()
+
+    def create_missing_indexes(self) -> List[str]:
+        """Create the indexes missing in the existing tables of a database created by a previous version of ComPath.
+
+        Creating the tables does not add new indexes to tables that already exist. It can be run several times.
+
+        :return: names of the created indexes
+        """
+        inspector = inspect(self.engine)
+        table_names = set(inspector.get_table_names())
+
+        created = []
+
+        for table in Base.metadata.sorted_tables:
+            if table.name not in table_names:
+                continue
+
+            index_names = {index['name'] for index in inspector.get_indexes(table.name)}
+
+            for index in table.indexes:
+                if index.name in index_names:
+                    continue
+
+                log.info('creating index %s on %s', index.name, table.name)
+                index.create(self.engine)
+                created.append(index.name)
+
+        return created
 
     def drop_all(self, check_first: bool = True):
         """Drop all tables for ComPath."""
         Base.metadata.drop_all(self.engine, checkfirst=check_first)
+        self.pathway_reference_ids.clear()
 
     """Query methods"""
 
@@ -135,18 +354,74 @@ class Manager(object):
         :param str mapping_type: mapping type (isPartOf or equivalentTo)
         :rtype: Optional[Mapping]
         """
+        reference_1_id = self.get_pathway_reference_id(service_1_name, pathway_1_id, pathway_1_name)
+        reference_2_id = self.get_pathway_reference_id(service_2_name, pathway_2_id, pathway_2_name)
+
+        if reference_1_id is None or reference_2_id is None:
+            return None
+
         mapping_filter = and_(
-            PathwayMapping.service_1_name == service_1_name,
-            PathwayMapping.service_1_pathway_id == pathway_1_id,
-            PathwayMapping.service_1_pathway_name == pathway_1_name,
-            PathwayMapping.service_2_name == service_2_name,
-            PathwayMapping.service_2_pathway_id == pathway_2_id,
-            PathwayMapping.service_2_pathway_name == pathway_2_name,
+            PathwayMapping.reference_1_id == reference_1_id,
+            PathwayMapping.reference_2_id == reference_2_id,
             PathwayMapping.type == mapping_type,
         )
 
         return self.session.query(PathwayMapping).filter(mapping_filter).one_or_none()
 
+    def get_pathway_reference_id(self, service_name, pathway_id, pathway_name) -> Optional[int]:
+        """Get the identifier of a pathway in the pathway reference table.
+
+        :param str service_name: service name
+        :param str pathway_id: original pathway identifier
+        :param str pathway_name: pathway name
+        :return: identifier or None if the pathway is not in any mapping
+        """
+        key = service_name, pathway_id, pathway_name
+        reference_id = self.pathway_reference_ids.get(key)
+
+        if reference_id is not None:
+            # Usually found in the identity map of the session without querying the database
+            reference = self.session.query(PathwayReference).get(reference_id)
+
+            if reference is not None and reference.as_tuple() == key:
+                return reference_id
+
+            # The reference has been deleted since it was cached, for example by another process, and its identifier
+            # may have been reused for another pathway
+            del self.pathway_reference_ids[key]
+
+        reference_id = self.session.query(PathwayReference.id).filter(and_(
+            PathwayReference.resource == service_name,
+            PathwayReference.pathway_id == pathway_id,
+            PathwayReference.name == pathway_name,
+        )).scalar()
+
+        if reference_id is not None:
+            self.pathway_reference_ids[key] = reference_id
+
+        return reference_id
+
+    def get_or_create_pathway_reference(self, service_name, pathway_id, pathway_name) -> PathwayReference:
+        """Get or create a pathway in the pathway reference table.
+
+        :param str service_name: service name
+        :param str pathway_id: original pathway identifier
+        :param str pathway_name: pathway name
+        """
+        key = service_name, pathway_id, pathway_name
+        reference_id = self.get_pathway_reference_id(*key)
+
+        if reference_id is not None:
+            return self.session.query(PathwayReference).get(reference_id)
+
+        reference = PathwayReference(resource=service_name, pathway_id=pathway_id, name=pathway_name)
+        self.session.add(reference)
+        self.session.flush()
+
+        self.pathway_reference_ids[key] = reference.id
+
+        return reference
+
     def get_mapping_by_id(self, mapping_id: int) -> Optional[PathwayMapping]:
         """Get a mapping by its id.
 
@@ -168,14 +443,20 @@ class Manager(object):
             vote = Vote(
                 user=user,
                 mapping=mapping,
-                type=vote_type
+                type=vote_type is not False
             )
 
+            _increment_vote_count(mapping, vote.type, 1)
+
             self.session.add(vote)
             self.session.commit()
 
         # If there was already a vote, and it's being changed
         elif vote_type is not None:
+            if vote.type != vote_type:
+                _increment_vote_count(mapping, vote.type, -1)
+                _increment_vote_count(mapping, vote_type, 1)
+
             vote.type = vote_type
             vote.changed = datetime.datetime.utcnow()
             self.session.commit()
@@ -247,13 +528,11 @@ class Manager(object):
             return mapping, False
 
         mapping = PathwayMapping(
-            service_1_name=service_1_name,
-            service_1_pathway_id=pathway_1_id,
-            service_1_pathway_name=pathway_1_name,
-            service_2_name=service_2_name,
-            service_2_pathway_id=pathway_2_id,
-            service_2_pathway_name=pathway_2_name,
-            type=mapping_type
+            reference_1=self.get_or_create_pathway_reference(service_1_name, pathway_1_id, pathway_1_name),
+            reference_2=self.get_or_create_pathway_reference(service_2_name, pathway_2_id, pathway_2_name),
+            type=mapping_type,
+            up_vote_count=1,
+            creator_count=1,
         )
 
         vote = Vote(
@@ -269,10 +548,12 @@ class Manager(object):
         return mapping, True
 
     def delete_all_mappings(self):
-        """Delete all the votes then all the mappings."""
+        """Delete all the votes then all the mappings and their pathways."""
         self.session.query(Vote).delete()
         self.session.query(PathwayMapping).delete()
+        self.session.query(PathwayReference).delete()
         self.session.commit()
+        self.pathway_reference_ids.clear()
 
     def delete_mapping_by_id(self, mapping_id):
         """Delete a mapping by its id.
@@ -302,6 +583,7 @@ class Manager(object):
             return False
 
         mapping.creators.append(user)
+        mapping.creator_count = PathwayMapping.creator_count + 1
         _ = self.get_or_create_vote(user, mapping)
         return True
 
@@ -324,6 +606,24 @@ class Manager(object):
         self.session.commit()
         return mapping, True
 
+    def _get_mappings_by_side(self, side_filters) -> List[PathwayMapping]:
+        """Get the mappings matching any of the filters of the sides of the mappings, in the order they were created.
+
+        The filters are queried as a UNION ALL instead of an OR, so each one can use the index of its side instead of
+        scanning the whole table.
+
+        :param tuple side_filters: filters of the first and second side of the mappings
+        """
+        query_1, query_2 = (
+            self.session.query(PathwayMapping).filter(side_filter)
+            for side_filter in side_filters
+        )
+
+        mappings = query_1.union_all(query_2).order_by(PathwayMapping.id).all()
+
+        # Mappings of a pathway to itself match both sides
+        return list(OrderedDict((mapping.id, mapping) for mapping in mappings).values())
+
     def get_mappings_from_pathway_with_relationship(self, type, service_name, pathway_id, pathway_name):
         """Get all mappings matching pathway and service name.
 
@@ -334,8 +634,12 @@ class Manager(object):
         :rtype: list[PathwayMapping]
         :return:
         """
-        return self.session.query(PathwayMapping).filter(
-            PathwayMapping.has_pathway_tuple(type, service_name, pathway_id, pathway_name)).all()
+        reference_id = self.get_pathway_reference_id(service_name, pathway_id, pathway_name)
+
+        if reference_id is None:
+            return []
+
+        return self._get_mappings_by_side(PathwayMapping.has_pathway_sides(reference_id, type=type))
 
     def get_decendents_mappings_from_pathway_with_is_part_of_relationship(self, service_name, pathway_id, pathway_name):
         """Get all mappings matching pathway and service name.
@@ -347,8 +651,13 @@ class Manager(object):
         :rtype: list[PathwayMapping]
         :return:
         """
+        reference_id = self.get_pathway_reference_id(service_name, pathway_id, pathway_name)
+
+        if reference_id is None:
+            return []
+
         return self.session.query(PathwayMapping).filter(
-            PathwayMapping.has_descendant_pathway_tuple(IS_PART_OF, service_name, pathway_id, pathway_name)).all()
+            PathwayMapping.has_descendant_pathway_tuple(IS_PART_OF, reference_id)).all()
 
     def get_ancestry_mappings_from_pathway_with_is_part_of_relationship(self, service_name, pathway_id, pathway_name):
         """Get all mappings matching pathway and service name.
@@ -360,8 +669,13 @@ class Manager(object):
         :rtype: list[PathwayMapping]
         :return:
         """
+        reference_id = self.get_pathway_reference_id(service_name, pathway_id, pathway_name)
+
+        if reference_id is None:
+            return []
+
         return self.session.query(PathwayMapping).filter(
-            PathwayMapping.has_ancestry_pathway_tuple(IS_PART_OF, service_name, pathway_id, pathway_name)).all()
+            PathwayMapping.has_ancestry_pathway_tuple(IS_PART_OF, reference_id)).all()
 
     def get_all_mappings_from_pathway(self, service_name, pathway_id, pathway_name):
         """Get all mappings matching pathway and service name.
@@ -372,8 +686,12 @@ class Manager(object):
         :rtype: list[PathwayMapping]
         :return:
         """
-        return self.session.query(PathwayMapping).filter(
-            PathwayMapping.has_pathway(service_name, pathway_id, pathway_name)).all()
+        reference_id = self.get_pathway_reference_id(service_name, pathway_id, pathway_name)
+
+        if reference_id is None:
+            return []
+
+        return self._get_mappings_by_side(PathwayMapping.has_pathway_sides(reference_id))
 
     def get_all_pathways_from_db_with_mappings(self, pathway_database):
         """Get all mappings that contain a pathway from a given database.
@@ -384,8 +702,7 @@ class Manager(object):
         :rtype: list[PathwayMapping]
         :return:
         """
-        return self.session.query(PathwayMapping).filter(
-            PathwayMapping.has_database_pathway(pathway_database)).all()
+        return self._get_mappings_by_side(PathwayMapping.has_database_pathway_sides(pathway_database))
 
     def infer_hierarchy(self, resource, pathway_id, pathway_name):
         """Infer the possible hierarchy of a given pathway based on its equivalent mappings.
@@ -422,3 +739,69 @@ class Manager(object):
                 ))
 
         return inferred_mappings
+
+    """Distributions"""
+
+    def store_distributions(self, resource, database_date, pathway_size_distribution, gene_distribution):
+        """Replace the stored distributions of a resource.
+
+        :param str resource: name of the resource
+        :param str database_date: date the resource was populated
+        :param dict[str,list] pathway_size_distribution: pathway identifier to [pathway name, number of proteins]
+        :param dict[str,int] gene_distribution: HGNC symbol to number of pathways
+        """
+        self.session.query(DistributionEntry).filter(DistributionEntry.resource == resource).delete()
+
+        self.session.bulk_insert_mappings(DistributionEntry, [
+            dict(
+                resource=resource,
+                database_date=database_date,
+                distribution=PATHWAY_SIZE_DISTRIBUTION,
+                key=pathway_id,
+                name=pathway_name,
+                count=size,
+            )
+            for pathway_id, (pathway_name, size) in pathway_size_distribution.items()
+        ])
+        self.session.bulk_insert_mappings(DistributionEntry, [
+            dict(
+                resource=resource,
+                database_date=database_date,
+                distribution=GENE_DISTRIBUTION,
+                key=hgnc_symbol,
+                count=count,
+            )
+            for hgnc_symbol, count in gene_distribution.items()
+        ])
+
+        self.session.commit()
+
+    def get_distributions(self, resource, database_date):
+        """Return the stored distributions of a resource if they were computed for the given populate date.
+
+        :param str resource: name of the resource
+        :param str database_date: date the resource was last populated
+        :rtype: Optional[tuple[dict[str,list],dict[str,int]]]
+        :return: pathway size distribution and gene distribution or None if they are missing or outdated
+        """
+        entries = self.session.query(
+            DistributionEntry.database_date,
+            DistributionEntry.distribution,
+            DistributionEntry.key,
+            DistributionEntry.name,
+            DistributionEntry.count,
+        ).filter(DistributionEntry.resource == resource).all()
+
+        if not entries or any(entry.database_date != database_date for entry in entries):
+            return None
+
+        pathway_size_distribution = {}
+        gene_distribution = {}
+
+        for _, distribution, key, name, count in entries:
+            if distribution == PATHWAY_SIZE_DISTRIBUTION:
+                pathway_size_distribution[key] = [name, count]
+            else:
+                gene_distribution[key] = count
+
+        return pathway_size_distribution, gene_distribution
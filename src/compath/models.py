@@ -5,7 +5,9 @@
 import datetime
 
 from flask_security import RoleMixin, UserMixin
-from sqlalchemy import Boolean, Column, DateTime, ForeignKey, Integer, String, Table, and_, or_
+from sqlalchemy import (
+    Boolean, Column, DateTime, ForeignKey, Index, Integer, String, Table, UniqueConstraint, and_, or_, select,
+)
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import backref, relationship
 
@@ -15,11 +17,17 @@ Base = declarative_base()
 
 TABLE_PREFIX = MODULE_NAME
 MAPPING_TABLE_NAME = '{}_mapping'.format(TABLE_PREFIX)
+PATHWAY_TABLE_NAME = '{}_pathway'.format(TABLE_PREFIX)
 VOTE_TABLE_NAME = '{}_vote'.format(TABLE_PREFIX)
 USER_TABLE_NAME = '{}_user'.format(TABLE_PREFIX)
 ROLE_TABLE_NAME = '{}_role'.format(TABLE_PREFIX)
 ROLES_USERS_TABLE_NAME = '{}_roles_users'.format(TABLE_PREFIX)
 MAPPING_USER_TABLE_NAME = '{}_mappings_users'.format(TABLE_PREFIX)
+DISTRIBUTION_TABLE_NAME = '{}_distribution'.format(TABLE_PREFIX)
+
+#: Types of entries in the distribution table
+PATHWAY_SIZE_DISTRIBUTION = 'pathway_size'
+GENE_DISTRIBUTION = 'gene'
 
 roles_users = Table(
     ROLES_USERS_TABLE_NAME,
@@ -70,6 +78,33 @@ class Role(Base, RoleMixin):
         return self.name
 
 
+class PathwayReference(Base):
+    """Pathway of a resource referenced by the mappings."""
+
+    __tablename__ = PATHWAY_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+
+    resource = Column(String(255), nullable=False, doc='service name (e.g., KEGG or Reactome')
+    pathway_id = Column(String(255), nullable=False, doc='pathway id in the resource')
+    name = Column(String(255), nullable=False, doc='pathway name')
+
+    __table_args__ = (
+        UniqueConstraint(resource, pathway_id, name),
+    )
+
+    def __str__(self):
+        """Return pathway info."""
+        return '{}:{}'.format(self.resource, self.name)
+
+    def as_tuple(self):
+        """Return the resource, pathway id and pathway name.
+
+        :rtype: tuple[str,str,str]
+        """
+        return self.resource, self.pathway_id, self.name
+
+
 class PathwayMapping(Base):
     """Mapping table."""
 
@@ -77,13 +112,11 @@ class PathwayMapping(Base):
 
     id = Column(Integer, primary_key=True)
 
-    service_1_name = Column(String(255), doc='service name (e.g., KEGG or Reactome')
-    service_1_pathway_id = Column(String(255), doc='pathway 1 id')
-    service_1_pathway_name = Column(String(255), doc='pathway 1 name')
+    reference_1_id = Column(Integer, ForeignKey(PathwayReference.id), nullable=False, doc='pathway 1')
+    reference_1 = relationship(PathwayReference, foreign_keys=[reference_1_id], lazy='joined')
 
-    service_2_name = Column(String(255), doc='service name (e.g., KEGG or Reactome')
-    service_2_pathway_id = Column(String(255), doc='pathway 2 id')
-    service_2_pathway_name = Column(String(255), doc='pathway 2 name')
+    reference_2_id = Column(Integer, ForeignKey(PathwayReference.id), nullable=False, doc='pathway 2')
+    reference_2 = relationship(PathwayReference, foreign_keys=[reference_2_id], lazy='joined')
 
     type = Column(String(255), doc='Type of Mapping (isPartOf or equivalentTo)')
 
@@ -91,6 +124,47 @@ class PathwayMapping(Base):
     creators = relationship('User', secondary=mappings_users, backref=backref('mappings', lazy='dynamic'),
                             lazy='dynamic')
 
+    # Counters of the votes and creators, kept up to date by the manager in the transactions that change them
+    up_vote_count = Column(Integer, nullable=False, default=0, server_default='0', doc='number of up votes')
+    down_vote_count = Column(Integer, nullable=False, default=0, server_default='0', doc='number of down votes')
+    creator_count = Column(Integer, nullable=False, default=0, server_default='0', doc='number of creators')
+
+    # Each side of the mappings is looked up by its pathway and the type of mapping
+    __table_args__ = (
+        Index('{}_reference_1_ix'.format(MAPPING_TABLE_NAME), reference_1_id, type),
+        Index('{}_reference_2_ix'.format(MAPPING_TABLE_NAME), reference_2_id, type),
+    )
+
+    @property
+    def service_1_name(self):
+        """Return the service name of pathway 1."""
+        return self.reference_1.resource
+
+    @property
+    def service_1_pathway_id(self):
+        """Return the id of pathway 1."""
+        return self.reference_1.pathway_id
+
+    @property
+    def service_1_pathway_name(self):
+        """Return the name of pathway 1."""
+        return self.reference_1.name
+
+    @property
+    def service_2_name(self):
+        """Return the service name of pathway 2."""
+        return self.reference_2.resource
+
+    @property
+    def service_2_pathway_id(self):
+        """Return the id of pathway 2."""
+        return self.reference_2.pathway_id
+
+    @property
+    def service_2_pathway_name(self):
+        """Return the name of pathway 2."""
+        return self.reference_2.name
+
     def __str__(self):
         """Return mapping info."""
         return '{} mapping from {}:{} to {}:{}'.format(
@@ -120,66 +194,71 @@ class PathwayMapping(Base):
             return self.service_1_name, self.service_1_pathway_id, self.service_1_pathway_name
 
     @staticmethod
-    def has_pathway_tuple(type, service_name, pathway_id, pathway_name):
-        """Return a filter to get all mappings matching type, service and pathway name and id."""
-        return or_(
-            and_(
-                PathwayMapping.service_1_name == service_name,
-                PathwayMapping.service_1_pathway_id == pathway_id,
-                PathwayMapping.service_1_pathway_name == pathway_name,
-                PathwayMapping.type == type
-            ),
-            and_(
-                PathwayMapping.service_2_name == service_name,
-                PathwayMapping.service_2_pathway_id == pathway_id,
-                PathwayMapping.service_2_pathway_name == pathway_name,
-                PathwayMapping.type == type
-            )
-        )
+    def has_pathway_sides(reference_id, type=None):
+        """Return the filters to get the mappings whose first or second pathway is the given pathway.
+
+        Each filter only uses the columns of one side, so it can be answered with the index of that side.
+
+        :param int reference_id: identifier of the pathway in the pathway reference table
+        :param Optional[str] type: mapping type. If not given, the mappings of all types are matched
+        :rtype: tuple
+        """
+        filters = []
+
+        for reference_column in (PathwayMapping.reference_1_id, PathwayMapping.reference_2_id):
+            conditions = [reference_column == reference_id]
+
+            if type is not None:
+                conditions.append(PathwayMapping.type == type)
+
+            filters.append(and_(*conditions))
+
+        return tuple(filters)
+
+    @staticmethod
+    def has_pathway_tuple(type, reference_id):
+        """Return a filter to get all mappings matching type and pathway."""
+        return or_(*PathwayMapping.has_pathway_sides(reference_id, type=type))
 
     @staticmethod
-    def has_descendant_pathway_tuple(type, service_name, pathway_id, pathway_name):
-        """Return a filter to get all the descendants mappings matching a isPartOf relationship (the predicates), service and pathway name and id."""
+    def has_descendant_pathway_tuple(type, reference_id):
+        """Return a filter to get all the descendants mappings matching a isPartOf relationship (the predicates) and pathway."""
         return and_(
-            PathwayMapping.service_2_name == service_name,
-            PathwayMapping.service_2_pathway_id == pathway_id,
-            PathwayMapping.service_2_pathway_name == pathway_name,
+            PathwayMapping.reference_2_id == reference_id,
             PathwayMapping.type == type
         )
 
     @staticmethod
-    def has_ancestry_pathway_tuple(type, service_name, pathway_id, pathway_name):
-        """Return a filter to get all the ancestries mappings matching a isPartOf relationship (the subjects), service and pathway name and id."""
+    def has_ancestry_pathway_tuple(type, reference_id):
+        """Return a filter to get all the ancestries mappings matching a isPartOf relationship (the subjects) and pathway."""
         return and_(
-            PathwayMapping.service_1_name == service_name,
-            PathwayMapping.service_1_pathway_id == pathway_id,
-            PathwayMapping.service_1_pathway_name == pathway_name,
+            PathwayMapping.reference_1_id == reference_id,
             PathwayMapping.type == type
         )
 
     @staticmethod
-    def has_pathway(service_name, pathway_id, pathway_name):
-        """Return a filter to get all mappings matching service and pathway name and id."""
-        return or_(
-            and_(
-                PathwayMapping.service_1_name == service_name,
-                PathwayMapping.service_1_pathway_id == pathway_id,
-                PathwayMapping.service_1_pathway_name == pathway_name,
-            ),
-            and_(
-                PathwayMapping.service_2_name == service_name,
-                PathwayMapping.service_2_pathway_id == pathway_id,
-                PathwayMapping.service_2_pathway_name == pathway_name,
-            )
+    def has_pathway(reference_id):
+        """Return a filter to get all mappings matching a pathway."""
+        return or_(*PathwayMapping.has_pathway_sides(reference_id))
+
+    @staticmethod
+    def has_database_pathway_sides(service_name):
+        """Return the filters to get the mappings whose first or second pathway is from a service.
+
+        :param str service_name: service name
+        :rtype: tuple
+        """
+        reference_ids = select([PathwayReference.id]).where(PathwayReference.resource == service_name)
+
+        return (
+            PathwayMapping.reference_1_id.in_(reference_ids),
+            PathwayMapping.reference_2_id.in_(reference_ids),
         )
 
     @staticmethod
     def has_database_pathway(service_name):
         """Return a filter to get all mappings matching service a name."""
-        return or_(
-            PathwayMapping.service_1_name == service_name,
-            PathwayMapping.service_2_name == service_name,
-        )
+        return or_(*PathwayMapping.has_database_pathway_sides(service_name))
 
     @property
     def count_votes(self):
@@ -187,7 +266,7 @@ class PathwayMapping(Base):
 
         :rtype: int
         """
-        return self.votes.count()
+        return self.up_vote_count + self.down_vote_count
 
     @property
     def count_creators(self):
@@ -195,7 +274,7 @@ class PathwayMapping(Base):
 
         :rtype: int
         """
-        return self.creators.count()
+        return self.creator_count
 
     @property
     def count_up_votes(self):
@@ -203,7 +282,7 @@ class PathwayMapping(Base):
 
         :rtype: int
         """
-        return self.votes.filter(Vote.type == True).count()
+        return self.up_vote_count
 
     @property
     def count_down_votes(self):
@@ -211,7 +290,7 @@ class PathwayMapping(Base):
 
         :rtype: int
         """
-        return self.votes.filter(Vote.type == False).count()
+        return self.down_vote_count
 
     @property
     def is_acceptable(self):
@@ -219,7 +298,7 @@ class PathwayMapping(Base):
 
         :rtype: bool
         """
-        return self.votes.filter(Vote.type == True).count() >= VOTE_ACCEPTANCE
+        return self.up_vote_count >= VOTE_ACCEPTANCE
 
     def get_user_vote(self, user):
         """Return votes given by the user."""
@@ -240,3 +319,18 @@ class Vote(Base):
 
     user_id = Column(Integer, ForeignKey(User.id), nullable=False)
     user = relationship(User, backref=backref('votes'))
+
+
+class DistributionEntry(Base):
+    """Pre-computed pathway size and gene distributions of the resources, stored when they are populated."""
+
+    __tablename__ = DISTRIBUTION_TABLE_NAME
+
+    id = Column(Integer, primary_key=True)
+
+    resource = Column(String(255), nullable=False, index=True, doc='name of the resource (e.g., kegg)')
+    database_date = Column(String(255), nullable=False, doc='date the resource was populated')
+    distribution = Column(String(255), nullable=False, doc='type of distribution (pathway_size or gene)')
+    key = Column(String(255), nullable=False, doc='pathway identifier or HGNC symbol')
+    name = Column(String(255), doc='pathway name')
+    count = Column(Integer, nullable=False, doc='number of proteins in the pathway or pathways with the gene')
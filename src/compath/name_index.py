@@ -0,0 +1,152 @@
+# -*- coding: utf-8 -*-
+
+"""Character trigram index over the pathway names, used to suggest mappings by name.
+
+Names are lower-cased and padded before being split into trigrams. A query is answered by counting the trigrams it
+shares with every name using the inverted index, ranking the names by their Dice coefficient and re-scoring only the
+best candidates with the exact string similarity of :func:`compath.utils.calculate_similarity`.
+"""
+
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from compath.constants import KEGG_SUFFIX
+from compath.utils import calculate_similarity, filter_results, get_top_matches
+
+__all__ = [
+    'clean_pathway_name',
+    'get_trigrams',
+    'NameIndex',
+]
+
+log = logging.getLogger(__name__)
+
+#: Number of names re-scored with the exact string similarity for each query
+CANDIDATES = 100
+
+
+def clean_pathway_name(name):
+    """Remove the resource specific suffixes of a pathway name.
+
+    :param str name: pathway name
+    :rtype: str
+    """
+    return name.replace(KEGG_SUFFIX, '')
+
+
+def get_trigrams(name):
+    """Return the character trigrams of a name.
+
+    :param str name: name
+    :rtype: set[str]
+    """
+    padded = '  {} '.format(' '.join(name.lower().split()))
+
+    return {
+        padded[i:i + 3]
+        for i in range(len(padded) - 2)
+    }
+
+
+class NameIndex(object):
+    """Inverted index from character trigrams to pathway names."""
+
+    def __init__(self, pathways):
+        """Build the index.
+
+        :param iter[tuple[str,str,str]] pathways: resource, pathway id and pathway name triplets
+        """
+        #: list of (resource, pathway id, cleaned pathway name)
+        self.entries = [
+            (resource, pathway_id, clean_pathway_name(pathway_name))
+            for resource, pathway_id, pathway_name in pathways
+        ]
+
+        postings = defaultdict(list)
+        sizes = []
+
+        for entry, (_, _, name) in enumerate(self.entries):
+            trigrams = get_trigrams(name)
+            sizes.append(len(trigrams))
+
+            for trigram in trigrams:
+                postings[trigram].append(entry)
+
+        #: trigram -> indexes of the entries with the trigram
+        self.postings = {
+            trigram: np.array(entries, dtype=np.int32)
+            for trigram, entries in postings.items()
+        }
+        #: number of distinct trigrams in each entry
+        self.sizes = np.array(sizes, dtype=np.int32)
+
+    @classmethod
+    def from_pathway_index(cls, pathway_index):
+        """Build the index of all pathways in a pathway index.
+
+        :param compath.pathway_index.PathwayIndex pathway_index: pathway index
+        :rtype: NameIndex
+        """
+        return cls(
+            (resource, pathway_id, pathway_name)
+            for resource, pathways in pathway_index.pathways.items()
+            for pathway_id, (pathway_name, _) in pathways.items()
+        )
+
+    def __len__(self):
+        """Return the number of names in the index."""
+        return len(self.entries)
+
+    def get_candidates(self, name, candidates=CANDIDATES):
+        """Return the entries that share the most trigrams with a name.
+
+        :param str name: name
+        :param int candidates: maximum number of candidates
+        :rtype: numpy.ndarray
+        :return: indexes of the candidate entries
+        """
+        trigrams = get_trigrams(name)
+
+        hits = [
+            self.postings[trigram]
+            for trigram in trigrams
+            if trigram in self.postings
+        ]
+
+        if not hits:
+            return np.array([], dtype=np.int64)
+
+        shared = np.bincount(np.concatenate(hits), minlength=len(self.entries))
+        dice = 2 * shared / (len(trigrams) + self.sizes)
+
+        matches = np.nonzero(shared)[0]
+
+        if len(matches) > candidates:
+            matches = np.sort(matches[np.argpartition(-dice[matches], candidates - 1)[:candidates]])
+
+        return matches
+
+    def search(self, name, threshold=0.4, top=5, candidates=CANDIDATES):
+        """Return the pathways with the most similar names.
+
+        The exact match of the name is excluded, like in :func:`compath.utils.get_most_similar_names`.
+
+        :param str name: pathway name
+        :param float threshold: minimum string similarity
+        :param int top: maximum number of results
+        :param int candidates: number of names re-scored with the exact string similarity
+        :rtype: list[tuple[str,str,str,float]]
+        :return: resource, pathway id, pathway name and similarity sorted by decreasing similarity
+        """
+        scores = [
+            (entry, calculate_similarity(name, self.entries[entry][2]))
+            for entry in self.get_candidates(name, candidates=candidates)
+            if self.entries[entry][2] != name
+        ]
+
+        return [
+            self.entries[entry] + (similarity,)
+            for entry, similarity in get_top_matches(filter_results(scores, threshold), top)
+        ]
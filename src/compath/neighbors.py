@@ -0,0 +1,140 @@
+# -*- coding: utf-8 -*-
+
+"""Index of the most similar pathways by content, used to suggest mappings.
+
+For every pathway, the index stores the top pathways of each resource ranked by the Szymkiewicz-Simpson coefficient of
+their gene sets. It is built from the :class:`compath.incidence.IncidenceMatrix` in blocks of rows, so the full
+similarity matrix is never held in memory, and it can be updated for the resources that were repopulated only.
+"""
+
+import logging
+from collections import defaultdict
+
+import numpy as np
+
+from compath.constants import TOP_CONTENT_NEIGHBORS
+
+__all__ = [
+    'NeighborIndex',
+]
+
+log = logging.getLogger(__name__)
+
+#: Number of rows of the similarity matrix computed at once
+BLOCK_SIZE = 512
+
+
+class NeighborIndex(object):
+    """Top-k most similar pathways of every pathway in each resource."""
+
+    def __init__(self, top=TOP_CONTENT_NEIGHBORS):
+        """Initialize an empty index.
+
+        :param int top: number of neighbors kept per pathway and resource
+        """
+        self.top = top
+        #: (resource, pathway id) -> resource -> list of (pathway id, similarity) sorted by decreasing similarity
+        self.neighbors = defaultdict(dict)
+
+    @classmethod
+    def from_incidence_matrix(cls, incidence_matrix, top=TOP_CONTENT_NEIGHBORS, previous=None, changed_resources=None):
+        """Build the index of all pathways in an incidence matrix keyed by (resource, pathway id).
+
+        If a previous index is given, only the neighbors involving the changed resources are recomputed.
+
+        :param compath.incidence.IncidenceMatrix incidence_matrix: incidence matrix
+        :param int top: number of neighbors kept per pathway and resource
+        :param Optional[NeighborIndex] previous: index built before the changed resources were repopulated
+        :param Optional[iter[str]] changed_resources: resources whose pathways changed since the previous index
+        :rtype: NeighborIndex
+        """
+        index = cls(top=top)
+
+        resource_keys = defaultdict(list)
+        for key in incidence_matrix.keys:
+            resource_keys[key[0]].append(key)
+
+        if previous is None or previous.top != top or changed_resources is None:
+            changed_resources = set(resource_keys)
+        else:
+            changed_resources = set(changed_resources).intersection(resource_keys)
+
+        unchanged_resources = set(resource_keys) - changed_resources
+
+        log.info('Building content neighbors for %s', sorted(changed_resources))
+
+        # Similarities between pathways of unchanged resources do not change
+        for resource in unchanged_resources:
+            for key in resource_keys[resource]:
+                index.neighbors[key] = {
+                    target_resource: neighbors
+                    for target_resource, neighbors in previous.neighbors.get(key, {}).items()
+                    if target_resource in unchanged_resources
+                }
+
+        index.update(
+            incidence_matrix,
+            [key for resource in changed_resources for key in resource_keys[resource]],
+            {resource: resource_keys[resource] for resource in resource_keys},
+        )
+        index.update(
+            incidence_matrix,
+            [key for resource in unchanged_resources for key in resource_keys[resource]],
+            {resource: resource_keys[resource] for resource in changed_resources},
+        )
+
+        return index
+
+    def update(self, incidence_matrix, keys, target_keys):
+        """Compute the neighbors of the given pathways in the target resources.
+
+        :param compath.incidence.IncidenceMatrix incidence_matrix: incidence matrix
+        :param list keys: pathway keys whose neighbors are computed
+        :param dict[str,list] target_keys: target resource to its pathway keys in the incidence matrix
+        """
+        if not keys or not target_keys:
+            return
+
+        targets = [
+            (resource, [pathway_id for _, pathway_id in keys_], len(keys_))
+            for resource, keys_ in target_keys.items()
+        ]
+        all_target_keys = [key for keys_ in target_keys.values() for key in keys_]
+
+        for start in range(0, len(keys), BLOCK_SIZE):
+            block_keys = keys[start:start + BLOCK_SIZE]
+            similarities = incidence_matrix.szymkiewicz_simpson(block_keys, all_target_keys)
+
+            offset = 0
+            for resource, pathway_ids, size in targets:
+                block = similarities[:, offset:offset + size]
+                offset += size
+
+                # Stable sort keeps the order of the incidence matrix for ties
+                top_columns = np.argsort(-block, axis=1, kind='stable')[:, :self.top]
+
+                for key, row, columns in zip(block_keys, block, top_columns):
+                    self.neighbors[key][resource] = [
+                        (pathway_ids[column], float(row[column]))
+                        for column in columns
+                        if row[column] > 0
+                    ]
+
+    def __contains__(self, key):
+        """Return if the pathway is in the index."""
+        return key in self.neighbors
+
+    def get_neighbors(self, resource, pathway_id):
+        """Return the most similar pathways in each resource.
+
+        :param str resource: name of the resource
+        :param str pathway_id: pathway identifier in the resource
+        :rtype: dict[str,list[tuple[str,float]]]
+        :return: resource to list of (pathway id, similarity) sorted by decreasing similarity. Resources without
+         similar pathways are not included
+        """
+        return {
+            target_resource: neighbors
+            for target_resource, neighbors in self.neighbors.get((resource, pathway_id), {}).items()
+            if neighbors
+        }
@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+
+"""In-memory index of the pathways and gene sets of the ComPath resources.
+
+The index is built once when the web application starts from the gene sets that are already exported from each
+Bio2BEL manager, so gene and gene set queries can be answered without touching the database.
+"""
+
+import logging
+from collections import Counter, defaultdict
+
+__all__ = [
+    'PathwayIndex',
+]
+
+log = logging.getLogger(__name__)
+
+
+class PathwayIndex(object):
+    """Inverted index from HGNC symbols to pathways plus a pathway to gene set table."""
+
+    def __init__(self):
+        """Initialize an empty index."""
+        #: resource -> pathway id -> (pathway name, gene set)
+        self.pathways = {}
+        #: HGNC symbol -> list of (resource, pathway id)
+        self.gene_to_pathways = defaultdict(list)
+
+    @classmethod
+    def from_gene_sets(cls, resource_gene_sets, resource_distributions):
+        """Build the index from the gene sets and pathway distributions loaded in the application.
+
+        :param dict[str,dict[str,set[str]]] resource_gene_sets: resource -> pathway name -> gene set
+        :param dict[str,dict[str,list]] resource_distributions: resource -> pathway id -> [pathway name, size]
+        :rtype: PathwayIndex
+        """
+        index = cls()
+
+        for resource, gene_sets in resource_gene_sets.items():
+            name_to_id = {
+                pathway_name: pathway_id
+                for pathway_id, (pathway_name, _) in resource_distributions.get(resource, {}).items()
+            }
+
+            index.add_resource(
+                resource,
+                (
+                    (name_to_id[pathway_name], pathway_name, gene_set)
+                    for pathway_name, gene_set in gene_sets.items()
+                    if pathway_name in name_to_id
+                )
+            )
+
+        return index
+
+    @property
+    def resources(self):
+        """Return the resources in the index.
+
+        :rtype: list[str]
+        """
+        return list(self.pathways)
+
+    def add_resource(self, resource, pathways):
+        """Add (or replace) the pathways of a resource.
+
+        :param str resource: name of the resource
+        :param iter[tuple[str,str,set[str]]] pathways: pathway id, pathway name and gene set triplets
+        """
+        if resource in self.pathways:
+            self.remove_resource(resource)
+
+        resource_pathways = self.pathways[resource] = {}
+
+        for pathway_id, pathway_name, gene_set in pathways:
+            if not gene_set:
+                continue
+
+            resource_pathways[pathway_id] = (pathway_name, gene_set)
+
+            for gene in gene_set:
+                self.gene_to_pathways[gene].append((resource, pathway_id))
+
+    def remove_resource(self, resource):
+        """Remove all the pathways of a resource from the index.
+
+        :param str resource: name of the resource
+        """
+        resource_pathways = self.pathways.pop(resource, {})
+
+        for _, gene_set in resource_pathways.values():
+            for gene in gene_set:
+                pathways = [
+                    pathway
+                    for pathway in self.gene_to_pathways.get(gene, [])
+                    if pathway[0] != resource
+                ]
+
+                if pathways:
+                    self.gene_to_pathways[gene] = pathways
+                else:
+                    self.gene_to_pathways.pop(gene, None)
+
+    def get_pathway(self, resource, pathway_id):
+        """Return the name and gene set of a pathway.
+
+        :param str resource: name of the resource
+        :param str pathway_id: pathway identifier in the resource
+        :rtype: Optional[tuple[str,set[str]]]
+        """
+        return self.pathways.get(resource, {}).get(pathway_id)
+
+    def get_gene_set(self, resource, pathway_id):
+        """Return the gene set of a pathway (empty if the pathway is not indexed).
+
+        :param str resource: name of the resource
+        :param str pathway_id: pathway identifier in the resource
+        :rtype: set[str]
+        """
+        pathway = self.get_pathway(resource, pathway_id)
+
+        if pathway is None:
+            return set()
+
+        return pathway[1]
+
+    def query_gene_set(self, gene_set):
+        """Return the pathways enriched by a gene set in every resource.
+
+        The result has the same structure as :meth:`compath_utils.CompathManager.query_gene_set` for each resource.
+
+        :param iter[str] gene_set: HGNC symbols
+        :rtype: dict[str,dict[str,dict]]
+        """
+        counters = {
+            resource: Counter()
+            for resource in self.pathways
+        }
+
+        for gene in set(gene_set):
+            for resource, pathway_id in self.gene_to_pathways.get(gene, []):
+                counters[resource][pathway_id] += 1
+
+        return {
+            resource: {
+                pathway_id: self._enrichment_entry(resource, pathway_id, mapped_proteins)
+                for pathway_id, mapped_proteins in counter.items()
+            }
+            for resource, counter in counters.items()
+        }
+
+    def _enrichment_entry(self, resource, pathway_id, mapped_proteins):
+        """Build the enrichment dictionary of a pathway."""
+        pathway_name, pathway_gene_set = self.pathways[resource][pathway_id]
+
+        return {
+            "pathway_id": pathway_id,
+            "pathway_name": pathway_name,
+            "mapped_proteins": mapped_proteins,
+            "pathway_size": len(pathway_gene_set),
+            "pathway_gene_set": pathway_gene_set,
+        }
+
+    def query_gene(self, gene):
+        """Return the pathways associated with a gene in every resource.
+
+        :param str gene: HGNC symbol
+        :rtype: dict[str,Optional[list[tuple[str,str,int]]]]
+        :return: resource to list of (pathway id, pathway name, pathway size) or None if the gene is not present
+        """
+        results = {
+            resource: None
+            for resource in self.pathways
+        }
+
+        for resource, pathway_id in self.gene_to_pathways.get(gene, []):
+            pathway_name, pathway_gene_set = self.pathways[resource][pathway_id]
+
+            if results[resource] is None:
+                results[resource] = []
+
+            results[resource].append((pathway_id, pathway_name, len(pathway_gene_set)))
+
+        return results
@@ -0,0 +1,352 @@
+# -*- coding: utf-8 -*-
+
+"""Precomputed simulations of the pathway coverage of combinations of resources.
+
+For a combination of resources, the simulation takes the genes present in all of them and calculates, for each
+resource, the fraction of its pathways that contain at least each threshold of those genes. The curves of every
+combination are computed offline with ``compath simulate`` in a process pool and saved to a JSON file that is loaded
+by the web application.
+
+The null coverage tells how many pathways of each resource random gene sets of a given size hit by chance. Batches of
+random gene sets drawn from the gene universe are encoded as a sparse matrix and intersected with all the pathways at
+once. Each batch has its own seeded random number generator, so the results do not depend on the number of processes.
+"""
+
+import itertools as itt
+import json
+import logging
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from operator import and_
+
+import numpy as np
+from scipy.sparse import csr_matrix
+
+from compath.constants import NULL_BATCH_SIZE, NULL_PERCENTILES, NULL_RUNS
+from compath.utils import simulate_pathway_enrichment
+
+__all__ = [
+    'get_combination_key',
+    'get_combinations',
+    'simulate_combination',
+    'simulate_combinations',
+    'simulate_null_coverage',
+    'save_simulations',
+    'load_simulations',
+]
+
+log = logging.getLogger(__name__)
+
+
+def get_combination_key(resources):
+    """Return the key of a combination of resources, independent of their order.
+
+    :param iter[str] resources: names of the resources
+    :rtype: str
+    """
+    return ','.join(sorted(resources))
+
+
+def get_combinations(resources):
+    """Return all the combinations of at least two of the resources (or the resource if there is only one).
+
+    :param iter[str] resources: names of the resources
+    :rtype: list[tuple[str]]
+    """
+    resources = sorted(set(resources))
+
+    if len(resources) == 1:
+        return [tuple(resources)]
+
+    return [
+        combination
+        for size in range(2, len(resources) + 1)
+        for combination in itt.combinations(resources, size)
+    ]
+
+
+def simulate_combination(resource_gene_sets, thresholds=None):
+    """Simulate the coverage of the genes shared by all the given resources.
+
+    :param dict[str,dict[str,set[str]]] resource_gene_sets: resource -> pathway name -> gene set
+    :param Optional[iter[int]] thresholds: minimum numbers of genes to enrich a pathway. Defaults to 1 to 199
+    :rtype: dict[str,list[float]]
+    :return: resource to fraction of its pathways with at least each threshold of shared genes
+    """
+    if not resource_gene_sets:
+        return {}
+
+    shared_genes = reduce(and_, (
+        {
+            gene
+            for gene_set in pathways.values()
+            for gene in gene_set
+        }
+        for pathways in resource_gene_sets.values()
+    ))
+
+    return simulate_pathway_enrichment(resource_gene_sets, shared_genes, thresholds=thresholds)
+
+
+def simulate_combinations(resource_gene_sets, combinations, thresholds=None, max_workers=None):
+    """Simulate the coverage of several combinations of resources in a process pool.
+
+    :param dict[str,dict[str,set[str]]] resource_gene_sets: resource -> pathway name -> gene set
+    :param iter[tuple[str]] combinations: combinations of resources
+    :param Optional[iter[int]] thresholds: minimum numbers of genes to enrich a pathway
+    :param Optional[int] max_workers: number of processes
+    :rtype: dict[str,dict[str,list[float]]]
+    :return: combination key to the results of :func:`simulate_combination`
+    """
+    thresholds = list(thresholds) if thresholds is not None else None
+
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            get_combination_key(combination): executor.submit(
+                simulate_combination,
+                {resource: resource_gene_sets[resource] for resource in combination},
+                thresholds,
+            )
+            for combination in combinations
+        }
+
+        return {
+            key: future.result()
+            for key, future in futures.items()
+        }
+
+
+class _NullModel(object):
+    """Pathways of all resources as a sparse matrix over the genes of the gene universe."""
+
+    def __init__(self, resource_gene_sets, gene_universe):
+        """Build the matrix.
+
+        :param dict[str,dict[str,set[str]]] resource_gene_sets: resource -> pathway name -> gene set
+        :param iter[str] gene_universe: genes from which the random gene sets are drawn
+        """
+        self.genes = sorted(gene_universe)
+        gene_to_column = {
+            gene: column
+            for column, gene in enumerate(self.genes)
+        }
+
+        #: resource -> (first row, last row) of its pathways
+        self.resource_rows = {}
+
+        indptr = [0]
+        indices = []
+
+        for resource, pathways in resource_gene_sets.items():
+            start = len(indptr) - 1
+
+            for gene_set in pathways.values():
+                # Genes outside the universe can never be drawn
+                indices.extend(sorted(gene_to_column[gene] for gene in gene_set if gene in gene_to_column))
+                indptr.append(len(indices))
+
+            self.resource_rows[resource] = start, len(indptr) - 1
+
+        self.matrix = csr_matrix(
+            (np.ones(len(indices), dtype=np.int32), np.array(indices, dtype=np.int32), np.array(indptr)),
+            shape=(len(indptr) - 1, len(self.genes)),
+        )
+
+    def draw(self, size, runs, random_state):
+        """Draw random gene sets without replacement.
+
+        :param int size: number of genes in each gene set
+        :param int runs: number of gene sets
+        :param numpy.random.RandomState random_state: random number generator
+        :rtype: scipy.sparse.csr_matrix
+        :return: runs x genes binary matrix
+        """
+        n_genes = len(self.genes)
+        size = min(size, n_genes)
+
+        # The positions of the smallest keys of a random permutation are a sample without replacement
+        columns = np.argpartition(random_state.random_sample((runs, n_genes)), size - 1, axis=1)[:, :size]
+
+        return csr_matrix(
+            (np.ones(runs * size, dtype=np.int32), columns.ravel(), np.arange(0, runs * size + 1, size)),
+            shape=(runs, n_genes),
+        )
+
+    def coverage_curves(self, gene_sets, thresholds):
+        """Calculate the coverage curve of each resource for each random gene set.
+
+        :param scipy.sparse.csr_matrix gene_sets: runs x genes binary matrix
+        :param numpy.ndarray thresholds: minimum numbers of genes to hit a pathway
+        :rtype: dict[str,numpy.ndarray]
+        :return: resource to runs x thresholds matrix with the fraction of its pathways hit
+        """
+        # pathways x runs
+        overlaps = (self.matrix @ gene_sets.T).toarray()
+        runs = gene_sets.shape[0]
+
+        curves = {}
+
+        for resource, (start, stop) in self.resource_rows.items():
+            resource_overlaps = overlaps[start:stop]
+            n_pathways = stop - start
+
+            if not n_pathways:
+                curves[resource] = np.zeros((runs, len(thresholds)))
+                continue
+
+            # Histogram of the overlap sizes of each run, the last bin is always empty
+            width = int(resource_overlaps.max()) + 2
+            bins = (resource_overlaps + np.arange(runs) * width).ravel()
+            histograms = np.bincount(bins, minlength=runs * width).reshape(runs, width)
+
+            # Number of pathways with at least each overlap size
+            at_least = histograms[:, ::-1].cumsum(axis=1)[:, ::-1]
+
+            curves[resource] = at_least[:, np.minimum(thresholds, width - 1)] / n_pathways
+
+        return curves
+
+
+#: Null model of the worker processes, set by :func:`_initialize_null_model`
+_null_model = None
+
+
+def _initialize_null_model(resource_gene_sets, gene_universe):
+    """Build the null model once in each worker process."""
+    global _null_model
+    _null_model = _NullModel(resource_gene_sets, gene_universe)
+
+
+def _simulate_null_batch(size, runs, thresholds, seed):
+    """Calculate the coverage curves of a batch of random gene sets with the null model of the worker.
+
+    :param int size: number of genes in each gene set
+    :param int runs: number of gene sets
+    :param numpy.ndarray thresholds: minimum numbers of genes to hit a pathway
+    :param list[int] seed: seed of the random number generator of the batch
+    :rtype: dict[str,numpy.ndarray]
+    """
+    random_state = np.random.RandomState(seed)
+
+    return _null_model.coverage_curves(_null_model.draw(size, runs, random_state), thresholds)
+
+
+def simulate_null_coverage(resource_gene_sets, gene_universe, sizes, thresholds=None, runs=NULL_RUNS,
+                           percentiles=NULL_PERCENTILES, seed=0, batch_size=NULL_BATCH_SIZE, max_workers=None):
+    """Simulate the coverage of random gene sets of several sizes in a process pool.
+
+    :param dict[str,dict[str,set[str]]] resource_gene_sets: resource -> pathway name -> gene set
+    :param iter[str] gene_universe: genes from which the random gene sets are drawn
+    :param iter[int] sizes: numbers of genes in the random gene sets
+    :param Optional[iter[int]] thresholds: minimum numbers of genes to hit a pathway. Defaults to 1 to 199
+    :param int runs: number of random gene sets of each size
+    :param iter[float] percentiles: percentiles of the coverage of the random gene sets
+    :param int seed: seed of the simulation
+    :param int batch_size: number of random gene sets processed at once
+    :param Optional[int] max_workers: number of processes
+    :rtype: dict[str,dict[str,dict[str,list[float]]]]
+    :return: resource -> size -> percentile -> fraction of its pathways hit at each threshold
+    :raises ValueError: if a size is smaller than 1
+    """
+    sizes = list(sizes)
+
+    if any(size < 1 for size in sizes):
+        raise ValueError('The random gene sets must contain at least one gene: {}'.format(sizes))
+
+    thresholds = np.asarray(list(thresholds) if thresholds is not None else range(1, 200))
+
+    with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=_initialize_null_model,
+            initargs=(resource_gene_sets, list(gene_universe)),
+    ) as executor:
+        futures = {
+            size: [
+                executor.submit(_simulate_null_batch, size, min(batch_size, runs - start), thresholds,
+                                [seed, size, batch])
+                for batch, start in enumerate(range(0, runs, batch_size))
+            ]
+            for size in sizes
+        }
+
+        results = {resource: {} for resource in resource_gene_sets}
+
+        for size, size_futures in futures.items():
+            batches = [future.result() for future in size_futures]
+
+            for resource, size_results in results.items():
+                curves = np.concatenate([batch[resource] for batch in batches])
+
+                size_results[str(size)] = {
+                    str(percentile): np.round(curve, 3).tolist()
+                    for percentile, curve in zip(percentiles, np.percentile(curves, percentiles, axis=0))
+                }
+
+    return results
+
+
+def save_simulations(path, simulations, thresholds, database_date=None, null_coverage=None):
+    """Save the simulations to a JSON file.
+
+    :param str path: output path
+    :param dict[str,dict[str,list[float]]] simulations: combination key to simulation results
+    :param iter[int] thresholds: thresholds used in the simulations
+    :param Optional[dict[str,str]] database_date: resource name to last populate date of the simulated data
+    :param Optional[dict] null_coverage: results of :func:`simulate_null_coverage`
+    """
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    with open(temporary_path, 'w') as file:
+        json.dump(
+            {
+                'created': time.strftime("%Y-%m-%d %H:%M:%S"),
+                'database_date': database_date or {},
+                'thresholds': list(thresholds),
+                'simulations': simulations,
+                'null_coverage': null_coverage or {},
+            },
+            file,
+        )
+
+    os.replace(temporary_path, path)
+
+
+def load_simulations(path, database_date=None):
+    """Load the simulations saved with :func:`save_simulations`.
+
+    :param str path: path to the simulations
+    :param Optional[dict[str,str]] database_date: resource name to last populate date, used to warn about outdated
+     simulations
+    :rtype: dict
+    :return: dictionary with the thresholds, the simulations (combination key to simulation results) and the null
+     coverage (resource -> size -> percentile -> curve). They are empty if the file does not exist or can not be read
+    """
+    data = {
+        'thresholds': [],
+        'simulations': {},
+        'null_coverage': {},
+    }
+
+    if not os.path.exists(path):
+        return data
+
+    try:
+        with open(path) as file:
+            data.update(json.load(file))
+    except Exception:
+        log.exception('Could not read simulations %s', path)
+        return data
+
+    if database_date is not None:
+        outdated = sorted(
+            resource
+            for resource, date in data.get('database_date', {}).items()
+            if database_date.get(resource) != date
+        )
+
+        if outdated:
+            log.warning('The simulations in %s are outdated for %s. Run compath simulate', path, outdated)
+
+    return data
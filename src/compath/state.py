@@ -0,0 +1,896 @@
+# -*- coding: utf-8 -*-
+
+"""This module builds the derived state served by the ComPath web application.
+
+The state is made of two parts:
+
+1. The state of each resource (pathway size distribution, gene distribution and gene sets), which only depends on the
+   content of the Bio2BEL database of that resource.
+2. The global state (simulation, overview, overlaps, gene universe and in-memory indexes), which depends on all
+   resources and on the HGNC gene universe.
+
+Both parts are stored in a versioned on-disk snapshot keyed by the date each database was last populated, so a restart
+only recomputes the resources that have been repopulated since the snapshot was written. The same mechanism is used to
+refresh a running application after a resource is repopulated: the new state is built aside and swapped in at once.
+"""
+
+import logging
+import os
+import pickle
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from functools import wraps
+from threading import Thread
+
+from bio2bel_hgnc.manager import Manager as HgncManager
+from flask import abort, current_app, g
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+from sqlalchemy.pool import NullPool
+
+from compath.autocompletion import build_gene_completions, build_pathway_completions
+from compath.clustering import Clustering
+from compath.constants import (
+    BLACK_LIST, CLUSTERGRAMMER_DIR, CLUSTERING_PATH, HGNC_MODULE_NAME, LANDSCAPE_PATH, SIMULATE_RESOURCES,
+    SIMULATION_PATH, SNAPSHOT_VERSION, STARTUP_WORKERS,
+)
+from compath.distributions import load_distributions, query_gene_sets, query_pathway_count
+from compath.incidence import IncidenceMatrix
+from compath.landscape import LandscapeNetwork
+from compath.manager import Manager
+from compath.name_index import NameIndex
+from compath.neighbors import NeighborIndex
+from compath.pathway_index import PathwayIndex
+from compath.simulation import load_simulations, simulate_combination
+from compath.utils import get_last_action_in_module
+from compath.visualization.clustergrammer import ClustergrammerMatrix
+from compath.visualization.venn_diagram import process_overlap_for_venn_diagram
+
+__all__ = [
+    'get_database_date',
+    'load_resource_state',
+    'get_resource_states',
+    'load_gene_universe',
+    'build_global_state',
+    'WarmupStatus',
+    'get_state',
+    'get_artifact',
+    'publish_state',
+    'set_artifact',
+    'set_resource_state',
+    'set_app_state',
+    'requires_artifacts',
+    'load_precomputed',
+    'refresh_precomputed',
+    'check_precomputed',
+    'load_snapshot',
+    'save_snapshot',
+    'get_database_dates',
+    'build_app_state',
+    'refresh_app_state',
+    'start_background_warmup',
+    'start_state_refresher',
+]
+
+log = logging.getLogger(__name__)
+
+#: Value used as database date when a resource has never been populated
+EMPTY_DATABASE = 'Empty'
+
+#: Artifacts of the application state that are built from each resource
+RESOURCE_ARTIFACTS = ('resource_distributions', 'gene_distributions')
+
+#: Artifacts of the application state that are built from all resources
+GLOBAL_ARTIFACTS = (
+    'gene_universe',
+    'pathway_index',
+    'name_index',
+    'gene_completions',
+    'pathway_completions',
+    'incidence_matrix',
+    'content_neighbors',
+    'resource_overview',
+    'simulation_results',
+    'manager_overlap',
+)
+
+#: All artifacts of the application state
+ARTIFACTS = RESOURCE_ARTIFACTS + GLOBAL_ARTIFACTS
+
+"""Database dates"""
+
+
+def get_database_date(resource_name):
+    """Return the last time the given resource was populated.
+
+    :param str resource_name: name of the Bio2BEL module
+    :rtype: str
+    """
+    action = get_last_action_in_module(resource_name, 'populate')
+
+    if not action:
+        return EMPTY_DATABASE
+
+    return action.created.strftime("%Y-%m-%d %H:%M:%S")
+
+
+"""Resource state"""
+
+
+def load_resource_state(manager, compath_manager=None, database_date=None):
+    """Load the pathway distribution, gene distribution, gene sets and number of pathways of a resource.
+
+    :param compath_utils.CompathManager manager: Bio2BEL manager of the resource
+    :param Optional[compath.manager.Manager] compath_manager: ComPath manager used to read the stored distributions
+    :param Optional[str] database_date: date the resource was last populated
+    :rtype: dict
+    """
+    resource_distributions, gene_distributions = load_distributions(
+        manager,
+        compath_manager=compath_manager,
+        database_date=database_date,
+    )
+
+    return {
+        'resource_distributions': resource_distributions,
+        'gene_distributions': gene_distributions,
+        'gene_sets': query_gene_sets(manager),
+        # The gene sets leave out the pathways without genes, which are still counted in the overview
+        'pathway_count': query_pathway_count(manager),
+    }
+
+
+def _load_resource_state_in_new_session(resource_name, manager, database_date=None):
+    """Load the state of a resource using a new manager with its own database session.
+
+    :param str resource_name: name of the resource
+    :param compath_utils.CompathManager manager: Bio2BEL manager of the resource
+    :param Optional[str] database_date: date the resource was last populated
+    :rtype: dict
+    """
+    engine = manager.engine
+
+    # SQLite connections can not be shared across threads, so each thread gets a non-pooled engine
+    if engine.dialect.name == 'sqlite':
+        engine = create_engine(engine.url, poolclass=NullPool)
+
+    session = scoped_session(sessionmaker(bind=engine))
+
+    try:
+        t = time.time()
+        resource_state = load_resource_state(
+            manager.__class__(engine=engine, session=session),
+            # The tables were set up by the manager of the application, so this one only uses the session
+            compath_manager=Manager(engine=engine, session=session, create_all=False),
+            database_date=database_date,
+        )
+        log.info('Loaded %s in %.2f seconds', resource_name, time.time() - t)
+        return resource_state
+
+    finally:
+        session.remove()
+
+        if engine is not manager.engine:
+            engine.dispose()
+
+
+def get_resource_states(manager_dict, database_date, snapshot=None, executor=None):
+    """Return the state of each resource, reusing the snapshot for the resources that were not repopulated.
+
+    :param dict[str,compath_utils.CompathManager] manager_dict: manager name to manager instances dictionary
+    :param dict[str,str] database_date: resource name to last populate date
+    :param Optional[dict] snapshot: snapshot loaded with :func:`load_snapshot`
+    :param Optional[concurrent.futures.Executor] executor: if given, resources are loaded concurrently, each one with
+     its own database session. Otherwise, they are loaded one after another with the session of their manager
+    :rtype: dict[str,dict]
+    """
+    cached_states = snapshot['resources'] if snapshot else {}
+
+    resource_states = {}
+    futures = {}
+
+    for resource_name, manager in manager_dict.items():
+        if resource_name in BLACK_LIST:
+            continue
+
+        cached_state = cached_states.get(resource_name)
+
+        if cached_state is not None and cached_state['database_date'] == database_date[resource_name]:
+            log.info('Using snapshot for %s', resource_name)
+            resource_states[resource_name] = cached_state['state']
+            continue
+
+        log.info('Loading %s', resource_name)
+
+        if executor is not None:
+            futures[resource_name] = executor.submit(
+                _load_resource_state_in_new_session,
+                resource_name,
+                manager,
+                database_date[resource_name],
+            )
+            continue
+
+        t = time.time()
+        resource_states[resource_name] = load_resource_state(manager)
+        log.info('Loaded %s in %.2f seconds', resource_name, time.time() - t)
+
+    for resource_name, future in futures.items():
+        resource_states[resource_name] = future.result()
+
+    return resource_states
+
+
+"""Global state"""
+
+
+def load_gene_universe(connection=None):
+    """Get the universe of all HGNC symbols from Bio2BEL HGNC and close the session.
+
+    :param Optional[str] connection: database connection
+    :rtype: set[str]
+    """
+    log.info('Loading gene universe from bio2BEL_hgnc ')
+    t = time.time()
+
+    hgnc_manager = HgncManager(connection=connection)
+
+    gene_universe = hgnc_manager.get_all_hgnc_symbols()
+
+    log.info('Loaded %d HGNC symbols in %.2f seconds', len(gene_universe), time.time() - t)
+
+    if len(gene_universe) < 40000:
+        log.warning(
+            'The number of HGNC symbols loaded is smaller than 40000. Please check that HGNC database has been'
+            'properly loaded'
+        )
+
+    hgnc_manager.session.close()
+
+    return gene_universe
+
+
+def build_global_state(resource_states, gene_universe, simulate_resources=None, callback=None, previous_state=None,
+                       changed_resources=None):
+    """Build the state that depends on all resources.
+
+    :param dict[str,dict] resource_states: resource name to resource state
+    :param set[str] gene_universe: all HGNC symbols
+    :param Optional[list[str]] simulate_resources: resources compared in the simulation
+    :param Optional[callable] callback: function called with the name and value of each artifact once it is built
+    :param Optional[dict] previous_state: global state built before the changed resources were repopulated
+    :param Optional[iter[str]] changed_resources: resources whose state changed since the previous global state
+    :rtype: dict
+    """
+    if simulate_resources is None:
+        simulate_resources = SIMULATE_RESOURCES
+
+    global_state = {}
+
+    def _publish(name, value):
+        global_state[name] = value
+
+        if callback is not None:
+            callback(name, value)
+
+    _publish('gene_universe', gene_universe)
+
+    resource_gene_sets = {
+        resource_name: state['gene_sets']
+        for resource_name, state in resource_states.items()
+    }
+
+    log.info('Building gene to pathway index')
+    pathway_index = PathwayIndex.from_gene_sets(
+        resource_gene_sets,
+        {
+            resource_name: state['resource_distributions']
+            for resource_name, state in resource_states.items()
+        }
+    )
+    _publish('pathway_index', pathway_index)
+
+    log.info('Building pathway name index')
+    _publish('name_index', NameIndex.from_pathway_index(pathway_index))
+
+    log.info('Building autocompletion')
+    _publish('gene_completions', build_gene_completions(gene_universe, pathway_index))
+    _publish('pathway_completions', build_pathway_completions(pathway_index))
+
+    log.info('Building pathway incidence matrix')
+    incidence_matrix = IncidenceMatrix.from_pathway_index(pathway_index)
+    _publish('incidence_matrix', incidence_matrix)
+
+    log.info('Building content neighbor index')
+    _publish('content_neighbors', NeighborIndex.from_incidence_matrix(
+        incidence_matrix,
+        previous=previous_state.get('content_neighbors') if previous_state else None,
+        changed_resources=changed_resources,
+    ))
+
+    log.info('Loading overlap across pathway databases')
+    # Flat all genes in all pathways in each resource to calculate overlap at the database level
+    resource_all_genes = {
+        resource: {
+            gene
+            for pathway, genes in pathways.items()
+            for gene in genes
+        }
+        for resource, pathways in resource_gene_sets.items()
+    }
+
+    log.info('Loading resource overview')
+    _publish('resource_overview', {
+        resource_name: (resource_states[resource_name]['pathway_count'], len(resource_all_genes[resource_name]))
+        # dict(Manager resource name: tuple(#pathways, #genes))
+        for resource_name in resource_gene_sets
+    })
+
+    simulated_resources = [
+        resource_name
+        for resource_name in resource_gene_sets
+        if resource_name in simulate_resources
+    ]
+
+    if simulated_resources:
+        log.info('Performing simulation with {}'.format(simulated_resources))
+
+        simulation_results = simulate_combination({
+            resource_name: resource_gene_sets[resource_name]
+            for resource_name in simulated_resources
+        })
+
+    else:
+        log.warning('No data has been fetched')
+        simulation_results = {}
+
+    _publish('simulation_results', simulation_results)
+
+    resource_all_genes['Gene Universe'] = gene_universe
+
+    _publish(
+        'manager_overlap',
+        process_overlap_for_venn_diagram(gene_sets=resource_all_genes, skip_gene_set_info=True)
+    )
+
+    return global_state
+
+
+"""Application state"""
+
+
+class WarmupStatus(object):
+    """Keep track of the artifacts of the application state that are ready to be served."""
+
+    def __init__(self, artifacts=ARTIFACTS):
+        """Initialize the status with no artifact ready.
+
+        :param iter[str] artifacts: names of the artifacts
+        """
+        self.artifacts = list(artifacts)
+        self.ready = set()
+        self.started = time.time()
+        self.finished = None
+        self.error = None
+
+    def mark_ready(self, artifact):
+        """Mark an artifact as ready.
+
+        :param str artifact: name of the artifact
+        """
+        self.ready.add(artifact)
+
+        if self.finished is None and self.ready.issuperset(self.artifacts):
+            self.finished = time.time()
+
+    def is_ready(self, *artifacts):
+        """Return if all the given artifacts are ready (all artifacts if none is given).
+
+        :param str artifacts: names of the artifacts
+        :rtype: bool
+        """
+        return self.ready.issuperset(artifacts or self.artifacts)
+
+    def fail(self, error):
+        """Record the error that stopped the warmup.
+
+        :param Exception error: error
+        """
+        self.error = error
+        self.finished = time.time()
+
+    def to_json(self):
+        """Summarize the progress of the warmup.
+
+        :rtype: dict
+        """
+        return {
+            'ready': self.is_ready(),
+            'progress': round(len(self.ready) / len(self.artifacts), 2) if self.artifacts else 1.0,
+            'artifacts': {
+                artifact: artifact in self.ready
+                for artifact in self.artifacts
+            },
+            'elapsed': round((self.finished or time.time()) - self.started, 2),
+            'error': None if self.error is None else str(self.error),
+        }
+
+
+def get_state():
+    """Return the state of the application pinned for the current request.
+
+    The state is read from the application once per request, so a request keeps using the same version of every
+    artifact even if a refresh swaps in a new state in the meantime.
+
+    :rtype: dict
+    """
+    if 'compath_state' not in g:
+        g.compath_state = current_app.state
+
+    return g.compath_state
+
+
+def get_artifact(name):
+    """Return an artifact of the state of the application pinned for the current request.
+
+    :param str name: name of the artifact
+    """
+    return get_state()[name]
+
+
+def publish_state(app, state):
+    """Replace the state of the application in a single assignment and mark its artifacts as ready.
+
+    :param flask.Flask app: ComPath application
+    :param dict state: artifact name to artifact
+    """
+    app.state = state
+
+    if getattr(app, 'warmup', None) is not None:
+        for name in state:
+            app.warmup.mark_ready(name)
+
+
+def set_artifact(app, name, value):
+    """Add an artifact to the state of the application.
+
+    :param flask.Flask app: ComPath application
+    :param str name: name of the artifact
+    :param value: artifact
+    """
+    publish_state(app, dict(getattr(app, 'state', {}), **{name: value}))
+
+
+def _get_resource_artifacts(resource_states):
+    """Return the artifacts built from the state of each resource.
+
+    :param dict[str,dict] resource_states: resource name to resource state
+    :rtype: dict
+    """
+    return {
+        artifact: {
+            resource_name: state[artifact]
+            for resource_name, state in resource_states.items()
+        }
+        for artifact in RESOURCE_ARTIFACTS
+    }
+
+
+def set_resource_state(app, resource_states):
+    """Add the artifacts built from the state of each resource to the state of the application.
+
+    :param flask.Flask app: ComPath application
+    :param dict[str,dict] resource_states: resource name to resource state
+    """
+    publish_state(app, dict(getattr(app, 'state', {}), **_get_resource_artifacts(resource_states)))
+
+
+def set_app_state(app, resource_states, global_state):
+    """Replace the whole state of the application at once.
+
+    :param flask.Flask app: ComPath application
+    :param dict[str,dict] resource_states: resource name to resource state
+    :param dict global_state: global state
+    """
+    publish_state(app, dict(_get_resource_artifacts(resource_states), **global_state))
+
+
+def requires_artifacts(*artifacts):
+    """Decorate a view so it returns 503 until the given artifacts of the application state are ready.
+
+    :param str artifacts: names of the artifacts used by the view
+    """
+
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            state = get_state()
+
+            if any(artifact not in state for artifact in artifacts):
+                return abort(503, 'ComPath is still loading. Please try again in a few minutes')
+
+            return view(*args, **kwargs)
+
+        return wrapped
+
+    return decorator
+
+
+"""Precomputed results"""
+
+
+def _get_modification_time(path):
+    """Return the modification time of a file or directory or None if it does not exist.
+
+    :param str path: path
+    :rtype: Optional[int]
+    """
+    try:
+        return os.stat(path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def _get_precomputed_key(resource_names, database_date):
+    """Return a key that changes when the files of the precomputed results are rewritten or a resource is repopulated.
+
+    :param iter[str] resource_names: names of the resources
+    :param dict[str,str] database_date: resource name to last populate date
+    :rtype: tuple
+    """
+    paths = [SIMULATION_PATH, CLUSTERING_PATH, LANDSCAPE_PATH] + [
+        os.path.join(CLUSTERGRAMMER_DIR, resource_name)
+        for resource_name in sorted(resource_names)
+    ]
+
+    return sorted(database_date.items()), [_get_modification_time(path) for path in paths]
+
+
+def _is_outdated(precomputed_date, database_date):
+    """Return if a result was precomputed from a different version of any of its resources.
+
+    :param Optional[dict[str,str]] precomputed_date: resource name to populate date of the precomputed data. If None,
+     the dates were not recorded and the result is assumed to be up to date
+    :param dict[str,str] database_date: resource name to last populate date
+    :rtype: bool
+    """
+    return any(
+        database_date.get(resource_name) != date
+        for resource_name, date in (precomputed_date or {}).items()
+    )
+
+
+def load_precomputed(app, database_date):
+    """Load the results precomputed with compath simulate, cluster, landscape and clustergrammer into the application.
+
+    The results precomputed from a different version of any of their resources are listed in
+    ``app.outdated_precomputed`` and the views that serve them with :func:`check_precomputed` return 503.
+
+    :param flask.Flask app: ComPath application with the manager_dict attribute
+    :param dict[str,str] database_date: resource name to last populate date
+    """
+    # Computed before loading, so files rewritten while loading are reloaded by the next refresh
+    app.precomputed_key = _get_precomputed_key(app.manager_dict, database_date)
+
+    # Coverage curves precomputed with compath simulate
+    app.simulations = load_simulations(SIMULATION_PATH, database_date=database_date)
+    # Linkage of all pathways precomputed with compath cluster
+    app.clustering = Clustering.load(CLUSTERING_PATH)
+    # Similarity network of all pathways precomputed with compath landscape
+    app.landscape = LandscapeNetwork.load(LANDSCAPE_PATH)
+    # Overlap matrices of each resource precomputed with compath clustergrammer
+    app.clustergrammer = {
+        resource_name: ClustergrammerMatrix.load(CLUSTERGRAMMER_DIR, resource_name, database_date.get(resource_name))
+        for resource_name in app.manager_dict
+    }
+
+    outdated = {
+        name
+        for name, precomputed_date in (
+            ('simulations', app.simulations.get('database_date')),
+            ('clustering', app.clustering and app.clustering.database_date),
+            ('landscape', app.landscape and app.landscape.database_date),
+        )
+        if _is_outdated(precomputed_date, database_date)
+    }
+    outdated.update(
+        'clustergrammer/{}'.format(resource_name)
+        for resource_name, matrix in app.clustergrammer.items()
+        if matrix is not None and _is_outdated({resource_name: matrix.database_date}, database_date)
+    )
+
+    if outdated:
+        log.warning('Outdated precomputed results: %s', ', '.join(sorted(outdated)))
+
+    app.outdated_precomputed = outdated
+
+
+def refresh_precomputed(app, database_date):
+    """Reload the precomputed results if their files were rewritten or a resource was repopulated since they were loaded.
+
+    :param flask.Flask app: ComPath application whose precomputed results were loaded with :func:`load_precomputed`
+    :param dict[str,str] database_date: resource name to last populate date
+    :rtype: bool
+    :return: if the precomputed results were reloaded
+    """
+    if getattr(app, 'precomputed_key', None) == _get_precomputed_key(app.manager_dict, database_date):
+        return False
+
+    log.info('Reloading the precomputed results')
+    load_precomputed(app, database_date)
+
+    return True
+
+
+def check_precomputed(name, command):
+    """Abort with 503 if a precomputed result used by the current request is outdated.
+
+    :param str name: name of the precomputed result (simulations, clustering, landscape or clustergrammer/<resource>)
+    :param str command: command of the command line interface that precomputes it
+    """
+    if name in getattr(current_app, 'outdated_precomputed', ()):
+        abort(503, 'The precomputed {} is outdated. Run compath {}'.format(name, command))
+
+
+"""Snapshot"""
+
+
+def load_snapshot(path):
+    """Load a snapshot written with :func:`save_snapshot`.
+
+    :param str path: path to the snapshot
+    :rtype: Optional[dict]
+    :return: snapshot or None if it does not exist, is corrupted or was written by another version
+    """
+    if not os.path.exists(path):
+        return None
+
+    try:
+        with open(path, 'rb') as file:
+            snapshot = pickle.load(file)
+    except Exception:
+        log.exception('Could not read snapshot %s', path)
+        return None
+
+    if not isinstance(snapshot, dict) or snapshot.get('version') != SNAPSHOT_VERSION:
+        log.info('Ignoring snapshot %s written by another version', path)
+        return None
+
+    return snapshot
+
+
+def save_snapshot(path, snapshot):
+    """Write a snapshot atomically, so other workers never read a partially written file.
+
+    :param str path: path to the snapshot
+    :param dict snapshot: snapshot
+    """
+    snapshot = dict(snapshot, version=SNAPSHOT_VERSION)
+
+    temporary_path = '{}.{}.tmp'.format(path, os.getpid())
+
+    try:
+        with open(temporary_path, 'wb') as file:
+            pickle.dump(snapshot, file, protocol=pickle.HIGHEST_PROTOCOL)
+
+        os.replace(temporary_path, path)
+
+    except Exception:
+        log.exception('Could not write snapshot %s', path)
+
+        if os.path.exists(temporary_path):
+            os.remove(temporary_path)
+
+
+def get_database_dates(manager_dict):
+    """Return the last time each resource was populated.
+
+    :param dict[str,compath_utils.CompathManager] manager_dict: manager name to manager instances dictionary
+    :rtype: dict[str,str]
+    """
+    return {
+        resource_name: get_database_date(resource_name)
+        for resource_name in manager_dict
+    }
+
+
+def _build_state(app, database_date, snapshot, connection=None, snapshot_path=None, max_workers=None,
+                 progressive=False):
+    """Build the state of the application from the given database dates, reusing the snapshot where possible.
+
+    :param flask.Flask app: ComPath application with the manager_dict attribute
+    :param dict[str,str] database_date: resource name to last populate date
+    :param Optional[dict] snapshot: previous snapshot
+    :param Optional[str] connection: database connection
+    :param Optional[str] snapshot_path: path where the new snapshot is saved
+    :param Optional[int] max_workers: number of threads used to load the resources
+    :param bool progressive: publish each artifact as soon as it is built instead of swapping the whole state at the end
+    """
+    t = time.time()
+
+    # The global state depends on every resource and the gene universe
+    global_key = (sorted(database_date.items()), get_database_date(HGNC_MODULE_NAME))
+    reuse_global_state = snapshot is not None and snapshot['global_key'] == global_key
+    reuse_gene_universe = snapshot is not None and snapshot['global_key'][1] == global_key[1]
+
+    with ThreadPoolExecutor(max_workers=max_workers or STARTUP_WORKERS) as executor:
+        if reuse_global_state:
+            gene_universe = None
+        elif reuse_gene_universe:
+            gene_universe = snapshot['global_state']['gene_universe']
+        else:
+            gene_universe = executor.submit(load_gene_universe, connection)
+
+        resource_states = get_resource_states(app.manager_dict, database_date, snapshot, executor=executor)
+
+        if progressive:
+            set_resource_state(app, resource_states)
+
+        if isinstance(gene_universe, Future):
+            gene_universe = gene_universe.result()
+
+    log.info('Loaded all resources in %.2f seconds', time.time() - t)
+
+    if reuse_global_state:
+        log.info('Using snapshot for the global state')
+        global_state = snapshot['global_state']
+
+    else:
+        cached_states = snapshot['resources'] if snapshot is not None else {}
+
+        global_state = build_global_state(
+            resource_states,
+            gene_universe,
+            callback=(lambda name, value: set_artifact(app, name, value)) if progressive else None,
+            previous_state=snapshot['global_state'] if snapshot is not None else None,
+            changed_resources=[
+                resource_name
+                for resource_name in resource_states
+                if cached_states.get(resource_name, {}).get('database_date') != database_date[resource_name]
+            ],
+        )
+
+    app.database_date = database_date
+    set_app_state(app, resource_states, global_state)
+
+    app.snapshot = {
+        'resources': {
+            resource_name: {
+                'database_date': database_date[resource_name],
+                'state': state,
+            }
+            for resource_name, state in resource_states.items()
+        },
+        'global_key': global_key,
+        'global_state': global_state,
+    }
+
+    if snapshot_path and not reuse_global_state:
+        log.info('Saving snapshot to %s', snapshot_path)
+        save_snapshot(snapshot_path, app.snapshot)
+
+
+def build_app_state(app, connection=None, snapshot_path=None, max_workers=None):
+    """Build the derived state of the application, using and updating the snapshot if a path is given.
+
+    The resources and the gene universe that need to be (re)loaded are loaded concurrently in a thread pool, so the
+    loading time is bounded by the slowest resource rather than by the sum of all of them. Each artifact is exposed in
+    the application as soon as it is built.
+
+    :param flask.Flask app: ComPath application with the manager_dict and database_date attributes
+    :param Optional[str] connection: database connection
+    :param Optional[str] snapshot_path: path to the snapshot. If None, everything is recomputed and nothing is saved
+    :param Optional[int] max_workers: number of threads used to load the resources
+    """
+    _build_state(
+        app,
+        app.database_date,
+        load_snapshot(snapshot_path) if snapshot_path else None,
+        connection=connection,
+        snapshot_path=snapshot_path,
+        max_workers=max_workers,
+        progressive=True,
+    )
+
+
+def refresh_app_state(app, connection=None, snapshot_path=None, max_workers=None):
+    """Rebuild the state of the application if any resource (or HGNC) has been repopulated since it was built.
+
+    Only the repopulated resources are reloaded from the database. The new state is built aside and swapped in with a
+    single assignment, so requests are served from the previous state until the new one is complete. The results
+    precomputed with the command line interface are reloaded as well, see :func:`refresh_precomputed`.
+
+    :param flask.Flask app: ComPath application whose state was built with :func:`build_app_state`
+    :param Optional[str] connection: database connection
+    :param Optional[str] snapshot_path: path where the new snapshot is saved
+    :param Optional[int] max_workers: number of threads used to load the resources
+    :rtype: bool
+    :return: if the state was refreshed
+    """
+    database_date = get_database_dates(app.manager_dict)
+
+    refresh_precomputed(app, database_date)
+
+    snapshot = getattr(app, 'snapshot', None)
+
+    # The state is still being built for the first time
+    if snapshot is None:
+        return False
+
+    if snapshot['global_key'] == (sorted(database_date.items()), get_database_date(HGNC_MODULE_NAME)):
+        return False
+
+    log.info(
+        'Refreshing the state after populating %s',
+        [
+            resource_name
+            for resource_name, date in database_date.items()
+            if date != app.database_date.get(resource_name)
+        ] or HGNC_MODULE_NAME
+    )
+    t = time.time()
+
+    _build_state(
+        app,
+        database_date,
+        snapshot,
+        connection=connection,
+        snapshot_path=snapshot_path,
+        max_workers=max_workers,
+    )
+
+    log.info('Refreshed the state in %.2f seconds', time.time() - t)
+
+    return True
+
+
+def start_background_warmup(app, connection=None, snapshot_path=None):
+    """Build the derived state of the application in a background thread.
+
+    The progress is tracked by the :class:`WarmupStatus` in ``app.warmup``, and the views decorated with
+    :func:`requires_artifacts` return 503 until the artifacts they need are ready.
+
+    :param flask.Flask app: ComPath application with the manager_dict and database_date attributes
+    :param Optional[str] connection: database connection
+    :param Optional[str] snapshot_path: path to the snapshot
+    :rtype: threading.Thread
+    """
+
+    def _warmup():
+        try:
+            build_app_state(app, connection=connection, snapshot_path=snapshot_path)
+        except Exception as e:
+            log.exception('Warmup failed')
+            app.warmup.fail(e)
+        else:
+            log.info('Warmup finished in %.2f seconds', time.time() - app.warmup.started)
+
+    thread = Thread(target=_warmup, name='compath-warmup', daemon=True)
+    thread.start()
+
+    return thread
+
+
+def start_state_refresher(app, interval, connection=None, snapshot_path=None):
+    """Poll the populate actions of the resources in a background thread and refresh the state when they change.
+
+    :param flask.Flask app: ComPath application
+    :param float interval: seconds between two polls
+    :param Optional[str] connection: database connection
+    :param Optional[str] snapshot_path: path where the new snapshots are saved
+    :rtype: threading.Thread
+    """
+
+    def _refresh():
+        while True:
+            time.sleep(interval)
+
+            try:
+                refresh_app_state(app, connection=connection, snapshot_path=snapshot_path)
+            except Exception:
+                log.exception('Failed to refresh the state')
+
+    thread = Thread(target=_refresh, name='compath-refresher', daemon=True)
+    thread.start()
+
+    return thread
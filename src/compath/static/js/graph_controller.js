@@ -18,7 +18,7 @@ function getProperty(dict, prop) {
 }
 
 /**
- * Returns the url of the json file needed to render cytsocape js visualization
+ * Returns the url of the network needed to render cytsocape js visualization
  * @returns {str} url
  */
 function getJsonPath() {
@@ -27,19 +27,7 @@ function getJsonPath() {
     var pathwayDatabase2 = $("#resource-input-2").val();
     var similarityThreshold = $("#similarity-range").val();
 
-    if (pathwayDatabase1 === pathwayDatabase2) {
-        path = "static/json/" + pathwayDatabase1 + "/" + pathwayDatabase1 + "_" + similarityThreshold + ".json"
-    }
-    else {
-        // order alphabetically the resources
-        var orderInputs = [pathwayDatabase1, pathwayDatabase2].sort();
-
-        // lookup the path
-        path = "static/json/all/" + orderInputs[0] + "_" + orderInputs[1] + "_" + similarityThreshold + ".json"
-
-    }
-
-    return path
+    return "/api/landscape/" + pathwayDatabase1 + "/" + pathwayDatabase2 + "?threshold=" + similarityThreshold / 100
 }
 
 /**
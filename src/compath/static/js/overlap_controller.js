@@ -166,7 +166,7 @@ $(document).ready(function () {
             e.preventDefault();
 
             $.ajax({
-                url: "/query/overlap?" + form.serialize(),
+                url: "/query/overlap?format=compact&" + form.serialize(),
                 type: 'GET',
                 dataType: "json",
                 success: function (data) {
@@ -178,7 +178,7 @@ $(document).ready(function () {
                     Venndiv.attr("align", "center"); // Align center the diagram
 
                     var geneOverlap = venn.VennDiagram(); // Plot the Venn Diagram
-                    Venndiv.datum(data[0]).call(geneOverlap); // Stick data
+                    Venndiv.datum(decodeVennDiagram(data[0])).call(geneOverlap); // Stick data
 
                     // Object pathway name -> url external database
                     window.urlExternal = data[1];
@@ -0,0 +1,35 @@
+/** This JS decodes the Venn diagrams sent in the compact format
+ **
+ * In the compact format, the gene symbols are listed once in "genes" and the genes of each region in "regions" are
+ * indexes into that list.
+ */
+
+/**
+ * Returns the regions of a Venn diagram with their gene symbols in "gene_set"
+ * @param {object|Array} data: Venn diagram in the compact format or list of regions
+ * @returns {Array} list of regions for venn.js
+ */
+function decodeVennDiagram(data) {
+
+    // Already a list of regions
+    if (Array.isArray(data)) {
+        return data;
+    }
+
+    return data.regions.map(function (region) {
+
+        var decodedRegion = {};
+
+        $.each(region, function (key, value) {
+            if (key !== "genes") {
+                decodedRegion[key] = value;
+            }
+        });
+
+        decodedRegion["gene_set"] = region.genes.map(function (geneIndex) {
+            return data.genes[geneIndex];
+        });
+
+        return decodedRegion;
+    });
+}